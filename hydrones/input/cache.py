@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    on-disk columnar cache of decoded files
+
+    each source file gets a sidecar directory holding one .npy file per
+    column and a manifest.json recording the path, size and modification
+    time of the source and the version of the decoder that produced it
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+MANIFEST = 'manifest.json'
+
+
+def cachePath(fileName, tag, cacheDir=None):
+    """
+        path of the cache directory of a source file
+
+        :param fileName: source file
+        :param tag: kind of decoded data (e.g. telemetry)
+        :param cacheDir: directory holding the caches (default: next to the source file)
+    """
+    if cacheDir is None:
+        return "%s.%s.cache" %(fileName, tag)
+    # (files of different flights often share their name)
+    key = hashlib.md5(os.path.abspath(fileName).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(cacheDir, "%s.%s.%s.cache" %(os.path.basename(fileName), key, tag))
+
+
+def _sourceState(fileName):
+    """
+        absolute path, size and modification time of a source file
+    """
+    stat = os.stat(fileName)
+    return {'path': os.path.abspath(fileName), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def readCache(fileName, tag, version, cacheDir=None):
+    """
+        memory-maps the cached columns of a source file
+
+        :param fileName: source file
+        :param tag: kind of decoded data
+        :param version: version of the decoder, the cache is stale if it differs
+        :param cacheDir: directory holding the caches
+
+        :return: dictionnary of columns, None if the cache is missing, stale or corrupt
+    """
+    path = cachePath(fileName, tag, cacheDir)
+    try:
+        with open(os.path.join(path, MANIFEST), 'r') as f:
+            manifest = json.load(f)
+        if manifest['source'] != _sourceState(fileName) or manifest['version'] != version:
+            return None
+        columns = dict()
+        for (name, description) in manifest['columns']:
+            values = np.load(os.path.join(path, description['file']), mmap_mode='c', allow_pickle=False)
+            if (list(values.shape) != description['shape']) or (values.dtype.str != description['dtype']):
+                return None
+            columns[name] = values
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+    return columns
+
+
+def writeCache(fileName, tag, version, columns, cacheDir=None):
+    """
+        stores decoded columns of a source file
+
+        :param fileName: source file
+        :param tag: kind of decoded data
+        :param version: version of the decoder
+        :param columns: dictionnary of arrays to store
+        :param cacheDir: directory holding the caches
+    """
+    path = cachePath(fileName, tag, cacheDir)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    # the manifest goes first and comes back last, an interrupted write
+    # leaves a cache without manifest which is rebuilt on next read
+    manifestFile = os.path.join(path, MANIFEST)
+    if os.path.exists(manifestFile):
+        os.remove(manifestFile)
+
+    description = []
+    for (i, name) in enumerate(columns.keys()):
+        values = np.ascontiguousarray(columns[name])
+        columnFile = "%03d.npy" %i
+        # (a new file replaces the old one: arrays still mapping the old
+        # column keep their data)
+        with open(os.path.join(path, columnFile + '.tmp'), 'wb') as f:
+            np.save(f, values, allow_pickle=False)
+        os.replace(os.path.join(path, columnFile + '.tmp'), os.path.join(path, columnFile))
+        description.append((name, {'file': columnFile, 'shape': list(values.shape), 'dtype': values.dtype.str}))
+
+    manifest = {'source': _sourceState(fileName), 'version': version, 'columns': description}
+    with open(manifestFile + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.rename(manifestFile + '.tmp', manifestFile)
+    return 0
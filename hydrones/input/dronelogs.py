@@ -5,48 +5,360 @@
     reads data from airborne log files
 """
 
-import datetime as dt
+import functools
+import multiprocessing
+import os
 import numpy as np
 import glob
 
+from input.cache import cachePath, readCache, writeCache
+
+# version of the log decoding, cached logs of another version are parsed again
+LOG_VERSION = 'dronelogs-1'
+
+# origin of GPS dates
+GPS_EPOCH = np.datetime64('1980-01-06T00:00:00', 'ns')
+
+# numpy type of the FMT format characters, as printed in text logs
+# (scaled fields such as c, e or L are printed as floats)
+FORMAT_TYPES = {'b': 'i8', 'B': 'i8', 'h': 'i8', 'H': 'i8', 'i': 'i8', 'I': 'i8',
+    'q': 'i8', 'Q': 'i8', 'M': 'i8',
+    'f': 'f8', 'd': 'f8', 'c': 'f8', 'C': 'f8', 'e': 'f8', 'E': 'f8', 'L': 'f8',
+    'n': 'U4', 'N': 'U16', 'Z': 'U64'}
+
+def _messageDtype(fmt, names):
+    """
+        numpy dtype of a message type from its FMT format and column names
+    """
+    if len(fmt) != len(names):
+        # inconsistent FMT line, fall back on floats
+        fmt = 'f' * len(names)
+    return np.dtype([(name, FORMAT_TYPES.get(c, 'f8')) for (c, name) in zip(fmt, names)])
+
+def _floatDtype(dtype):
+    """
+        same structured dtype with integer fields as floats
+    """
+    return np.dtype([(name, 'f8' if dtype[name].kind in 'iu' else dtype[name]) for name in dtype.names])
+
+def _splitMessage(values, dtype):
+    """
+        splits the fields of a message line whose text field contains
+        commas, the extra fields are joined back into the widest text field
+
+        :return: list of fields, None if the line has too few fields or no text field
+    """
+    fields = values.rstrip('\r\n').split(',')
+    extra = len(fields) - len(dtype.names)
+    text = [i for i in range(len(dtype.names)) if dtype[i].kind == 'U']
+    if extra < 0 or len(text) == 0:
+        return None
+    i = max(text, key=lambda j: dtype[j].itemsize)
+    fields[i:i+extra+1] = [','.join(fields[i:i+extra+1])]
+    return fields
+
+def _parseMessages(lines, dtype, usecols):
+    """
+        converts the text lines of a message type in bulk
+
+        :param lines: list of lines (without the message type)
+        :param dtype: dtype of the whole message
+        :param usecols: indices of the columns to convert
+
+        :return: structured array of the selected columns
+    """
+    outDtype = np.dtype([(dtype.names[i], dtype[i]) for i in usecols])
+    if len(lines) == 0:
+        return np.zeros(0, dtype=outDtype)
+
+    # lines with the expected number of fields are converted by loadtxt
+    regular = np.array([values.count(',') == len(dtype.names) - 1 for values in lines])
+    regularLines = [values for (values, ok) in zip(lines, regular) if ok]
+    try:
+        if len(regularLines) == 0:
+            raise ValueError("no regular lines")
+        table = np.loadtxt(regularLines, delimiter=',', dtype=outDtype, usecols=usecols, comments=None, ndmin=1)
+    except ValueError:
+        # integers printed as floats: convert line by line, numbers as floats
+        outDtype = _floatDtype(outDtype)
+        rows = [values.rstrip('\r\n').split(',') for values in regularLines]
+        table = np.array([tuple(row[i] for i in usecols) for row in rows], dtype=outDtype)
+    if regular.all():
+        return table
+
+    # the others have commas in their text field, or are truncated
+    rows = [_splitMessage(values, dtype) for (values, ok) in zip(lines, regular) if not ok]
+    kept = np.array([row is not None for row in rows])
+    if not kept.all():
+        print("skipped %s malformed lines" %np.count_nonzero(~kept))
+    rows = [tuple(row[i] for i in usecols) for row in rows if row is not None]
+    try:
+        others = np.array(rows, dtype=outDtype)
+    except ValueError:
+        outDtype = _floatDtype(outDtype)
+        others = np.array(rows, dtype=outDtype)
+        table = table.astype(outDtype)
+
+    # back in the order of the lines
+    keep = regular.copy()
+    keep[~regular] = kept
+    merged = np.zeros(len(lines), dtype=outDtype)
+    merged[regular] = table
+    merged[np.flatnonzero(~regular)[kept]] = others
+    return merged[keep]
+
+def readLogMessages(fileName, msgTypes=None, columns=None):
+    """
+        reads several message types of a log file in a single pass
+
+        FMT lines give the columns and types of each message type, every
+        other line is routed to the buffer of its message type, then each
+        buffer is converted in bulk
+
+        :param fileName: log file to read
+        :param msgTypes: list of message types to extract (default: all,
+                         or the keys of columns)
+        :param columns: projection, dictionnary giving the columns to
+                        extract for some message types, e.g.
+                        {'POS': ['TimeUS','Lat','Lng','Alt']} (None for
+                        all columns), other columns are never converted
+
+        :return: dictionnary of data dictionnaries, one per message type
+    """
+    if columns is None:
+        columns = dict()
+    if msgTypes is None and len(columns) > 0:
+        msgTypes = list(columns.keys())
+
+    formats = dict()
+    buffers = dict()
+
+    for ligne in open(fileName, 'r'):
+        (msgType, _, values) = ligne.partition(',')
+        msgType = msgType.strip()
+        if msgType == 'FMT':
+            listLigne = ligne.rstrip().replace(' ','').split(',')
+            if (msgTypes is None) or (listLigne[3] in msgTypes):
+                formats[listLigne[3]] = (listLigne[4], listLigne[5:])
+        elif (msgTypes is None) or (msgType in msgTypes):
+            buffers.setdefault(msgType, []).append(values)
+
+    messages = dict()
+    for msgType in formats.keys():
+        (fmt, names) = formats[msgType]
+        dtype = _messageDtype(fmt, names)
+        selected = columns.get(msgType)
+        if selected is None:
+            selected = names
+        for name in selected:
+            if name not in names:
+                raise Exception("no column %s in %s messages" %(name, msgType))
+        usecols = [names.index(name) for name in selected]
+        table = _parseMessages(buffers.get(msgType, []), dtype, usecols)
+        messages[msgType] = dict()
+        for name in selected:
+            values = table[name]
+            if values.dtype.kind == 'U':
+                values = np.char.strip(values)
+            messages[msgType][name] = np.ascontiguousarray(values)
+    return messages
+
+# binary (DataFlash) logs: each record starts with two sync bytes and the
+# message type id, FMT records (id 128) describe the other message types
+BIN_HEAD = (0xA3, 0x95)
+BIN_FMT_ID = 128
+BIN_FMT_DTYPE = np.dtype([('type','u1'), ('length','u1'), ('name','S4'), ('format','S16'), ('columns','S64')])
+
+# binary type and scale factor of the FMT format characters
+BIN_FORMAT_TYPES = {'a': ('<i2', (32,)), 'b': 'i1', 'B': 'u1', 'h': '<i2', 'H': '<u2',
+    'i': '<i4', 'I': '<u4', 'q': '<i8', 'Q': '<u8', 'M': 'u1',
+    'f': '<f4', 'd': '<f8', 'c': '<i2', 'C': '<u2', 'e': '<i4', 'E': '<u4', 'L': '<i4',
+    'n': 'S4', 'N': 'S16', 'Z': 'S64'}
+BIN_FORMAT_SCALES = {'c': 1e-2, 'C': 1e-2, 'e': 1e-2, 'E': 1e-2, 'L': 1e-7}
+
+def _gatherRecords(buf, offsets, dtype, chunk=16384):
+    """
+        gathers records of the same type at arbitrary offsets of a buffer
+
+        :param buf: uint8 array
+        :param offsets: offsets of the record payloads
+        :param dtype: dtype of a record payload
+
+        :return: structured array of records
+    """
+    records = np.zeros(len(offsets), dtype=dtype)
+    raw = records.view(np.uint8).reshape(len(offsets), dtype.itemsize)
+    columns = np.arange(dtype.itemsize)
+    for first in range(0, len(offsets), chunk):
+        index = offsets[first:first + chunk, np.newaxis] + columns
+        raw[first:first + chunk] = buf[index]
+    return records
+
+def readBinLogMessages(fileName, msgTypes=None, columns=None):
+    """
+        reads several message types of a binary (DataFlash) log file
+
+        FMT records are scanned first to build a dtype per message type,
+        records of each type are then located and extracted with
+        vectorized offset gathering
+
+        records start at the sync bytes whose message type is known and
+        whose payload fits in the file; among overlapping candidates (sync
+        bytes inside a payload or in corrupted bytes), the one followed by
+        another candidate (or the end of the file) one record length later
+        is kept, else the first one
+
+        :param fileName: log file to read
+        :param msgTypes: list of message types to extract (default: all,
+                         or the keys of columns)
+        :param columns: projection, see readLogMessages
+
+        :return: dictionnary of data dictionnaries, one per message type,
+                 as readLogMessages (scaled values as floats)
+    """
+    if columns is None:
+        columns = dict()
+    if msgTypes is None and len(columns) > 0:
+        msgTypes = list(columns.keys())
+
+    buf = np.fromfile(fileName, dtype=np.uint8)
+    size = len(buf)
+    starts = np.flatnonzero((buf[:-2] == BIN_HEAD[0]) & (buf[1:-1] == BIN_HEAD[1]))
+
+    # message formats
+    fmtStarts = starts[(buf[starts + 2] == BIN_FMT_ID) & (starts + 3 + BIN_FMT_DTYPE.itemsize <= size)]
+    fmts = _gatherRecords(buf, fmtStarts + 3, BIN_FMT_DTYPE)
+    lengths = np.zeros(256, dtype=np.int64)
+    formats = dict()
+    for record in fmts:
+        name = record['name'].decode('ascii', 'replace')
+        fmt = record['format'].decode('ascii', 'replace')
+        names = record['columns'].decode('ascii', 'replace').split(',')
+        if any([c not in BIN_FORMAT_TYPES for c in fmt]) or len(fmt) != len(names):
+            continue
+        dtype = np.dtype([(n, BIN_FORMAT_TYPES[c]) for (c, n) in zip(fmt, names)])
+        if dtype.itemsize + 3 != record['length']:
+            # not a FMT record
+            continue
+        lengths[record['type']] = record['length']
+        formats[record['type']] = (name, fmt, names, dtype)
+
+    # record candidates: sync bytes of a known message type whose payload fits
+    msgIds = buf[starts + 2]
+    ends = starts + lengths[msgIds]
+    valid = (lengths[msgIds] > 0) & (ends <= size)
+    # chained candidates are followed by another one (or the end of the file)
+    isStart = np.zeros(size + 1, dtype=bool)
+    isStart[starts[valid]] = True
+    isStart[size] = True
+    chained = isStart[np.minimum(ends, size)]
+
+    # overlapping candidates: the chained one is kept, else the first one
+    while True:
+        kept = np.flatnonzero(valid)
+        inside = starts[kept[1:]] < ends[kept[:-1]]
+        # only settle the overlaps whose first candidate does not start inside another one
+        conflict = inside.copy()
+        conflict[1:] &= ~inside[:-1]
+        if not conflict.any():
+            break
+        first = kept[:-1][conflict]
+        second = kept[1:][conflict]
+        valid[np.where(chained[second] & ~chained[first], first, second)] = False
+
+    messages = dict()
+    for msgId in formats.keys():
+        (name, fmt, names, dtype) = formats[msgId]
+        if (msgTypes is not None) and (name not in msgTypes):
+            continue
+        selected = columns.get(name)
+        if selected is None:
+            selected = names
+        for column in selected:
+            if column not in names:
+                raise Exception("no column %s in %s messages" %(column, name))
+        records = _gatherRecords(buf, starts[valid & (msgIds == msgId)] + 3, dtype)
+        messages[name] = dict()
+        for column in selected:
+            c = fmt[names.index(column)]
+            values = records[column]
+            if values.dtype.kind == 'S':
+                values = np.char.strip(np.char.decode(values, 'latin-1'))
+            elif c in BIN_FORMAT_SCALES:
+                values = values * BIN_FORMAT_SCALES[c]
+            elif values.dtype.kind == 'f':
+                values = values.astype(np.float64)
+            else:
+                values = values.astype(np.int64)
+            messages[name][column] = values
+    return messages
+
 def extractVar(fileName, varName):
     """
         extracts only lines corresponding to varName in fileName
         :return: data dictionnairy
     """
-    for ligne in open(fileName,'r'):
-        if (ligne.startswith('FMT') & (varName in ligne)):
-            listLigne = ligne.rstrip().replace(' ','').split(',')[5:]
-            nbVal = len(listLigne)
-            data=dict.fromkeys(listLigne)
-            for k in data.keys():
-                data[k] = np.array([])
-        if ligne.startswith(varName):
-            ligneSansVariable = ligne.replace(varName+',','')
-            listVal = np.float_(ligneSansVariable.rstrip().split(','))
-            for i in range(nbVal):
-                data[listLigne[i]] = np.append(data[listLigne[i]], listVal[i])
-    return data
+    messages = readLogMessages(fileName, [varName])
+    if varName not in messages:
+        raise Exception("no FMT line for %s in %s" %(varName, fileName))
+    return messages[varName]
+
+def gpsToDatetime64(week, ms, leapSeconds=0):
+    """
+        converts GPS weeks and milliseconds of week to dates
+
+        :param week: array of GPS weeks
+        :param ms: array of milliseconds in the week
+        :param leapSeconds: seconds to subtract (GPS - UTC offset, e.g. 18 since 2017)
+
+        :return: datetime64[ns] array
+    """
+    ns = (np.asarray(week).astype(np.int64) * 604800 * 10**9
+        + np.rint(np.asarray(ms, dtype=np.float64) * 10**6).astype(np.int64)
+        - int(round(leapSeconds * 1e9)))
+    return GPS_EPOCH + ns.astype('timedelta64[ns]')
 
-def readLogFile(fileName):
+def readLogFile(fileName, leapSeconds=0, cache=False, cacheDir=None):
     """
-        reads from an airborne log file
-        :return: dictionnary containing
+        reads from an airborne log file, text or binary (.bin)
+
+        :param leapSeconds: GPS - UTC offset subtracted from the GPS dates
+        :param cache: if True, parsed columns are stored in (and read back from) a sidecar cache,
+                      columns read back are copy-on-write maps which keep their values when
+                      the cache is rebuilt later
+        :param cacheDir: directory of the caches (default: next to the log file)
+
+        :return: dictionnary containing the POS columns, AbsoluteDate
+                 (datetime64[ns]) and roll/pitch/yaw angles
     """
     print("reading log data from %s" %fileName)
 
+    version = "%s-leap%r" %(LOG_VERSION, leapSeconds)
+    if cache:
+        columns = readCache(fileName, 'dronelogs', version, cacheDir=cacheDir)
+        if columns is not None:
+            print("using cache %s" %cachePath(fileName, 'dronelogs', cacheDir))
+            return columns
+
     # Read Log Airborne
-    pos = extractVar(fileName, 'POS')
-    gps = extractVar(fileName, 'GPS')
-    ekf1 = extractVar(fileName, 'EKF1')
+    if fileName.lower().endswith('.bin'):
+        readMessages = readBinLogMessages
+    else:
+        readMessages = readLogMessages
+    messages = readMessages(fileName, columns={'POS': None, 'GPS': ['TimeUS', 'GMS', 'GWk'],
+        'EKF1': ['TimeUS', 'Roll', 'Pitch', 'Yaw']})
+    pos = messages['POS']
+    gps = messages['GPS']
+    ekf1 = messages['EKF1']
 
     # Datation des position a l'aide de la date GPS
-    dateRef = dt.datetime(1980, 1, 6, 0, 0, 0, 0)
     clockPos = pos['TimeUS']
     clockGPS = gps['TimeUS']
-    secGPSfromRef = np.array([gps['GMS'][i]/1e3 + gps['GWk'][i]*7*86400.0 for i in range(len(gps['TimeUS']))])
-    secPosfromRef = np.interp(clockPos, clockGPS, secGPSfromRef)
-    pos['AbsoluteDate'] = np.array([dateRef + dt.timedelta(seconds=s) for s in secPosfromRef])
+    dateGPS = gpsToDatetime64(gps['GWk'], gps['GMS'], leapSeconds=leapSeconds)
+    # interpolation in ns from the first GPS date, to keep the precision
+    nsGPS = (dateGPS - dateGPS[0]).astype(np.int64)
+    nsPos = np.rint(np.interp(clockPos, clockGPS, nsGPS)).astype(np.int64)
+    pos['AbsoluteDate'] = dateGPS[0] + nsPos.astype('timedelta64[ns]')
 
     # Interpolation des roll/pitch/yaw angle sur la clockPos:
     clockEKF1 = ekf1['TimeUS']
@@ -57,25 +369,47 @@ def readLogFile(fileName):
     pos['Pitch'] = np.interp(clockPos, clockEKF1, pitch)
     pos['Yaw'] = np.interp(clockPos, clockEKF1, yaw)
 
+    if cache:
+        try:
+            writeCache(fileName, 'dronelogs', version, pos, cacheDir=cacheDir)
+        except (IOError, OSError) as e:
+            print("warning: cannot write cache %s (%s)" %(cachePath(fileName, 'dronelogs', cacheDir), e))
     return pos
 
-def readLogDirectory(directory, pattern='*.log'):
+def readLogDirectory(directory, pattern='*.log', leapSeconds=0, workers=None, cache=False, cacheDir=None):
     """
         reads all log files matching pattern in directory
+
+        :param leapSeconds: GPS - UTC offset (see readLogFile)
+        :param workers: number of processes parsing files concurrently
+                        (default None reads the files one after another)
+        :param cache: use the sidecar caches of the files (see readLogFile)
+        :param cacheDir: directory of the caches
+
         :return: dictionnary containing the data
     """
 
     print("reading drone logs from %s" %directory)
-    listFile = sorted(glob.glob("%s/%s" %(directory, pattern)))
+    # (sidecar cache directories are skipped)
+    listFile = [f for f in sorted(glob.glob("%s/%s" %(directory, pattern))) if os.path.isfile(f)]
     print("%s files were found" %len(listFile))
 
-    data = dict()
+    # parse all files, results are kept in the sorted file order
+    readFile = functools.partial(readLogFile, leapSeconds=leapSeconds, cache=cache, cacheDir=cacheDir)
+    if workers is not None and workers > 1 and len(listFile) > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(readFile, listFile)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [readFile(fileName) for fileName in listFile]
 
-    for fileName in listFile:
-        currentData = readLogFile(fileName)
+    # a single concatenation per key
+    data = dict()
+    for currentData in results:
         for key in currentData.keys():
-            if key in data.keys():
-                data[key] = np.append(data[key], currentData[key])
-            else:
-                data[key] = currentData[key]
+            if key not in data.keys():
+                data[key] = np.concatenate([other[key] for other in results if key in other])
     return data
@@ -6,10 +6,15 @@
 """
 
 
+import bisect
 import datetime as dt
-import struct
+import functools
+import hashlib
+import multiprocessing
+import os
 import numpy as np
 import glob
+from input.cache import cachePath, readCache, writeCache
 
 MEAS_KEYS = ['year','month','day','hour','min','sec','usec',
     'gps_lat','gps_lon','gps_nbsat','gps_geoidheight','gps_altitude',
@@ -21,359 +26,767 @@ MEAS_KEYS = ['year','month','day','hour','min','sec','usec',
     'imu_linear_accel_x','imu_linear_accel_y','imu_linear_accel_z']
 CLOCK_KEYS = ['imu','leddar','baro','gps']
 
+# fields of each sensor block, in the order written by the acquisition board
+# (little endian, packed)
+SENSOR_FIELDS = {
+    'gps': [('clock','<f8'),
+        ('year','<u2'),('month','u1'),('day','u1'),('hour','u1'),('min','u1'),('sec','u1'),('usec','<u4'),
+        ('gps_lat','<f4'),('gps_lon','<f4'),('gps_geoidheight','<f4'),('gps_nbsat','<u4'),('gps_altitude','<f4')],
+    'baro': [('clock','<f8'),
+        ('baro_pressure','<f4'),('baro_sea_level_pressure','<f4'),('baro_altitude','<f4'),('baro_temperature','<f4')],
+    'leddar': [('clock','<f8'),
+        ('leddar_range','<f4'),('leddar_amplitude','<u4')],
+    'imu': [('clock','<f8'),
+        ('imu_pitch_angle','<f4'),('imu_roll_angle','<f4'),('imu_yaw_angle','<f4'),
+        ('imu_accel_x','<f4'),('imu_accel_y','<f4'),('imu_accel_z','<f4'),
+        ('imu_linear_accel_x','<f4'),('imu_linear_accel_y','<f4'),('imu_linear_accel_z','<f4'),
+        ('imu_grav_accel_x','<f4'),('imu_grav_accel_y','<f4'),('imu_grav_accel_z','<f4')]}
+
+# frame layouts: sequence of (sensor, number of consecutive blocks)
+FRAME_LAYOUTS = {
+    # 1 gps, 2 baro, 4 imu and 18 leddar measurements
+    'mode1': [('gps',1), ('baro',1), ('leddar',4), ('imu',1), ('leddar',4), ('imu',1),
+        ('baro',1), ('leddar',4), ('imu',1), ('leddar',4), ('imu',1), ('leddar',2)],
+    # 1 gps, 1 baro, 1 imu and 24 leddar measurements
+    'mode2': [('gps',1), ('leddar',8), ('baro',1), ('leddar',8), ('imu',1), ('leddar',8)]}
+
+# plausible values of the date fields, used to validate frames
+PLAUSIBLE_RANGES = {'year': (2000, 2100), 'month': (1, 12), 'day': (1, 31),
+    'hour': (0, 23), 'min': (0, 59), 'sec': (0, 60), 'usec': (0, 999999)}
+
+
+class FrameLayout(object):
+    """
+        frame layout compiled to a numpy dtype and a vectorized decoder
+    """
+
+    def __init__(self, name, blocks):
+        """
+            constructor
+
+            :param name: name of the layout (mode)
+            :param blocks: sequence of (sensor, repetitions), see FRAME_LAYOUTS
+        """
+        self.name = name
+        # names of the blocks of each sensor, in frame order
+        self.blocks = dict()
+        fields = []
+        for (i, (sensor, count)) in enumerate(blocks):
+            blockName = '%s%d' %(sensor, i)
+            fields.append((blockName, np.dtype(SENSOR_FIELDS[sensor]), (count,)))
+            self.blocks.setdefault(sensor, []).append(blockName)
+        self.dtype = np.dtype(fields)
+        # identifies the binary layout, changes whenever a block or field changes
+        self.version = hashlib.sha1(str(self.dtype.descr).encode('utf-8')).hexdigest()
+
+    def sensorOf(self, key):
+        """
+            returns the sensor a measurement key belongs to
+        """
+        for sensor, names in self.blocks.items():
+            if key in self.dtype[names[0]].base.names:
+                return sensor
+        raise KeyError(key)
+
+    def gather(self, frames, sensor, field):
+        """
+            gathers one field of all the blocks of a sensor
+
+            :param frames: structured array of frames
+            :param sensor: name of the sensor
+            :param field: name of the field to gather
+
+            :return: float array of shape (frames, samples per frame)
+        """
+        values = [frames[name][field] for name in self.blocks[sensor]]
+        return np.concatenate(values, axis=1).astype(np.float64)
+
+    def samplesPerFrame(self, sensor):
+        """
+            number of samples of a sensor in each frame
+        """
+        return sum([self.dtype[name].shape[0] for name in self.blocks[sensor]])
+
+    def arrange(self, values, perFrame=False):
+        """
+            lays out (frames, samples) values
+
+            :param values: gathered values, see gather
+            :param perFrame: if False, values are flattened in time order,
+                             if True, they are kept as (frames, samples),
+                             or (frames,) for sensors sampled once per frame
+        """
+        if not perFrame:
+            return values.ravel()
+        if values.shape[1] == 1:
+            return values[:, 0]
+        return values
+
+    def decode(self, frames, perFrame=False):
+        """
+            splits an array of frames into measurement and clock columns
+
+            :param frames: structured array of frames
+            :param perFrame: keep one row per frame (see arrange)
+
+            :return: two dictionnaries, meas, clock
+        """
+        meas = dict()
+        clock = dict()
+        for sensor, names in self.blocks.items():
+            for field in self.dtype[names[0]].base.names:
+                values = self.arrange(self.gather(frames, sensor, field), perFrame=perFrame)
+                if field == 'clock':
+                    clock[sensor] = values
+                else:
+                    meas[field] = values
+        # keep the usual key order
+        meas = dict((key, meas[key]) for key in MEAS_KEYS if key in meas)
+        clock = dict((key, clock[key]) for key in CLOCK_KEYS if key in clock)
+        return (meas, clock)
+
+    def plausible(self, frames):
+        """
+            checks the plausibility of each frame on its own:
+            date fields in PLAUSIBLE_RANGES, finite values, clocks positive
+            and increasing within the frame
+
+            :param frames: structured array of frames
+
+            :return: boolean array, True for plausible frames
+        """
+        valid = np.ones(len(frames), dtype=bool)
+        # garbage bytes give NaN/Inf, which are expected here
+        with np.errstate(invalid='ignore', over='ignore'):
+            for sensor, names in self.blocks.items():
+                for field in self.dtype[names[0]].base.names:
+                    values = self.gather(frames, sensor, field)
+                    valid &= np.all(np.isfinite(values), axis=1)
+                    if field in PLAUSIBLE_RANGES:
+                        (low, high) = PLAUSIBLE_RANGES[field]
+                        valid &= np.all((values >= low) & (values <= high), axis=1)
+                clock = self.gather(frames, sensor, 'clock')
+                valid &= np.all(clock >= 0, axis=1) & np.all(np.diff(clock, axis=1) >= 0, axis=1)
+        return valid
+
+    def follows(self, previous, frames):
+        """
+            checks that frames come after previous frames (same length)
+            for the clocks of all sensors
+        """
+        valid = np.ones(len(frames), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for sensor in self.blocks.keys():
+                first = frames[self.blocks[sensor][0]]['clock'][:, 0]
+                last = previous[self.blocks[sensor][-1]]['clock'][:, -1]
+                valid &= first >= last
+        return valid
+
+    def validate(self, frames, previous=None):
+        """
+            checks the plausibility of all frames at once (see plausible),
+            a frame going back in time after a plausible one is not plausible
+
+            :param frames: structured array of frames
+            :param previous: optional plausible frame preceding frames (array of one
+                             frame), the first frame must come after it
+
+            :return: boolean array, True for plausible frames
+        """
+        valid = self.plausible(frames)
+        if len(frames) > 1:
+            valid[1:] &= ~(valid[:-1] & ~self.follows(frames[:-1], frames[1:]))
+        if previous is not None and len(frames) > 0:
+            valid[:1] &= self.follows(previous, frames[:1])
+        return valid
+
+    def resync(self, buf, minFrames=3, blockFrames=4096, searchFrames=8):
+        """
+            splits a raw buffer into plausible frames, skipping corrupted
+            or misaligned bytes
+
+            frames are validated by blocks of blockFrames, each against the
+            last kept frame; after an implausible frame, the next frame
+            boundary following the last kept frame is searched (see
+            nextBoundary), so the clocks of the kept frames never go back
+
+            :param buf: uint8 array (e.g. a memory-mapped file)
+            :param minFrames: number of plausible frames needed to resynchronize
+            :param blockFrames: number of frames validated at once
+            :param searchFrames: number of frames searched at once for a boundary
+
+            :return: (frames, skipped) structured array of the plausible frames
+                     and list of skipped (first, last) byte ranges
+        """
+        frameSize = self.dtype.itemsize
+        size = len(buf)
+        segments = []
+        skipped = []
+        offset = 0
+        # last kept frame
+        previous = None
+
+        while size - offset >= frameSize:
+            nbFrames = min(blockFrames, (size - offset) // frameSize)
+            frames = buf[offset:offset + nbFrames * frameSize].view(self.dtype)
+            invalid = np.flatnonzero(~self.validate(frames, previous=previous))
+            if len(invalid) == 0:
+                segments.append(frames)
+                previous = frames[-1:]
+                offset += nbFrames * frameSize
+                continue
+            segments.append(frames[:invalid[0]])
+            if invalid[0] > 0:
+                previous = frames[invalid[0]-1:invalid[0]]
+            bad = offset + int(invalid[0]) * frameSize
+            offset = self.nextBoundary(buf, bad + 1, minFrames=minFrames, searchFrames=searchFrames,
+                previous=previous)
+            skipped.append((bad, offset))
+
+        if offset < size:
+            # trailing incomplete frame
+            skipped.append((offset, size))
+        if len(segments) == 0:
+            return (np.zeros(0, dtype=self.dtype), skipped)
+        return (np.concatenate(segments), skipped)
+
+    def nextBoundary(self, buf, start, minFrames=3, searchFrames=8, previous=None):
+        """
+            finds the first byte offset from start followed by minFrames
+            plausible frames (fewer at the end of the buffer), the first of
+            them coming after previous (optional array of one frame)
+
+            frames starting at every byte offset of a window of searchFrames
+            frames are checked with a single vectorized validation
+
+            :return: offset of the boundary, len(buf) if there is none
+        """
+        frameSize = self.dtype.itemsize
+        size = len(buf)
+
+        while size - start >= frameSize:
+            # number of offsets where a whole frame fits
+            available = size - start - frameSize + 1
+            run = minFrames
+            while run > 1 and available <= (run - 1) * frameSize:
+                run -= 1
+            nbStarts = min(searchFrames * frameSize, available - (run - 1) * frameSize)
+
+            # overlapping frames, one per byte offset
+            frames = np.ndarray((nbStarts + (run - 1) * frameSize,), dtype=self.dtype,
+                buffer=buf, offset=start, strides=(1,))
+            plausible = self.plausible(frames)
+
+            found = plausible[:nbStarts]
+            if previous is not None:
+                found = found & self.follows(previous, frames[:nbStarts])
+            for i in range(1, run):
+                earlier = frames[(i - 1) * frameSize:(i - 1) * frameSize + nbStarts]
+                later = frames[i * frameSize:i * frameSize + nbStarts]
+                found = found & plausible[i * frameSize:i * frameSize + nbStarts] & self.follows(earlier, later)
+
+            hits = np.flatnonzero(found)
+            if len(hits) > 0:
+                return start + int(hits[0])
+            start += nbStarts
+        return size
+
+
+# compiled layouts, built on first use
+_compiledLayouts = dict()
+
+
+def getLayout(mode):
+    """
+        returns the compiled layout of a mode, compiling it on first use
+    """
+    if mode not in FRAME_LAYOUTS:
+        raise Exception("mode %s is unknown" %mode)
+    if mode not in _compiledLayouts:
+        _compiledLayouts[mode] = FrameLayout(mode, FRAME_LAYOUTS[mode])
+    return _compiledLayouts[mode]
+
+
+def registerLayout(mode, blocks):
+    """
+        adds (or replaces) a frame layout
+
+        :param mode: name of the layout
+        :param blocks: sequence of (sensor, repetitions), sensors being keys of SENSOR_FIELDS
+    """
+    for (sensor, count) in blocks:
+        if sensor not in SENSOR_FIELDS:
+            raise Exception("sensor %s is unknown" %sensor)
+    FRAME_LAYOUTS[mode] = list(blocks)
+    _compiledLayouts.pop(mode, None)
+
+
+def detectMode(fileName):
+    """
+        finds the layout whose frame size divides the file size
+
+        :return: name of the detected mode
+    """
+    size = os.path.getsize(fileName)
+    candidates = [mode for mode in sorted(FRAME_LAYOUTS) if size % getLayout(mode).dtype.itemsize == 0]
+    if size == 0 and len(candidates) > 0:
+        return candidates[0]
+    if len(candidates) != 1:
+        raise Exception("cannot detect the mode of %s (candidates: %s)" %(fileName, candidates))
+    return candidates[0]
+
+
+def _mapFrames(fileName, dtype):
+    """
+        memory-maps all complete frames of a telemetry file
+        a trailing incomplete frame is ignored
+    """
+    nbFrames = os.path.getsize(fileName) // dtype.itemsize
+    if nbFrames == 0:
+        # mmap cannot map an empty region
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(fileName, dtype=dtype, mode='r', shape=(nbFrames,))
+
 
+def _mapBytes(fileName):
+    """
+        memory-maps a whole file as bytes
+    """
+    if os.path.getsize(fileName) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(fileName, dtype=np.uint8, mode='r')
+
+
+def _keptOffsets(skipped, size, frameSize):
+    """
+        byte offsets of the frames kept by a resync: the ranges between
+        the skipped ones hold whole frames
+    """
+    bounds = [0] + [bound for byteRange in skipped for bound in byteRange] + [size]
+    offsets = [np.arange(first, last - frameSize + 1, frameSize, dtype=np.int64)
+        for (first, last) in zip(bounds[0::2], bounds[1::2])]
+    return np.concatenate(offsets)
+
+
+class TelemetryFile(object):
+    """
+        lazy access to the frames of a telemetry file
+
+        the file is memory-mapped, so only the frames actually
+        used are read from the disk
+    """
+
+    def __init__(self, fileName, mode='mode1', frames=None, resync=False):
+        """
+            constructor
+
+            :param fileName: telemetry file to map
+            :param mode: frame layout of the file, 'auto' to detect it
+            :param frames: already mapped frames (used for slicing)
+            :param resync: if True, implausible frames are dropped and frame
+                           boundaries are searched again after them (see
+                           FrameLayout.resync), the selected frames are then
+                           copied in memory and skipped byte ranges are
+                           listed in self.skipped
+
+            the byte offset in the file of each frame is kept in self.offsets
+            (None when frames are given)
+        """
+        if mode == 'auto':
+            mode = detectMode(fileName)
+        self.fileName = fileName
+        self.mode = mode
+        self.layout = getLayout(mode)
+        self.skipped = []
+        self.resynced = resync and frames is None
+        self.offsets = None
+        if frames is None:
+            frameSize = self.layout.dtype.itemsize
+            if resync:
+                buf = _mapBytes(fileName)
+                (frames, self.skipped) = self.layout.resync(buf)
+                self.offsets = _keptOffsets(self.skipped, len(buf), frameSize)
+            else:
+                frames = _mapFrames(fileName, self.layout.dtype)
+                self.offsets = np.arange(len(frames), dtype=np.int64) * frameSize
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        """
+            selects frames by index or slice
+
+            :return: telemetry file object sharing the same mapping
+        """
+        if not isinstance(index, slice):
+            index = range(len(self.frames))[index]
+            index = slice(index, index + 1)
+        selection = TelemetryFile(self.fileName, mode=self.mode, frames=self.frames[index])
+        if self.offsets is not None:
+            selection.offsets = self.offsets[index]
+        return selection
+
+    def column(self, key, perFrame=False):
+        """
+            decodes a single measurement column
+
+            :param key: one of MEAS_KEYS
+            :param perFrame: keep one row per frame
+
+            :return: array of values
+        """
+        values = self.layout.gather(self.frames, self.layout.sensorOf(key), key)
+        return self.layout.arrange(values, perFrame=perFrame)
+
+    def clock(self, sensor, perFrame=False):
+        """
+            decodes the clock values of a sensor
+
+            :param sensor: one of CLOCK_KEYS
+            :param perFrame: keep one row per frame
+
+            :return: array of clock values
+        """
+        values = self.layout.gather(self.frames, sensor, 'clock')
+        return self.layout.arrange(values, perFrame=perFrame)
+
+    def frameClock(self, sensor='gps'):
+        """
+            clock of the first sample of a sensor in each frame
+
+            :param sensor: one of CLOCK_KEYS
+
+            :return: view on the mapped clock values
+        """
+        name = self.layout.blocks[sensor][0]
+        return self.frames[name]['clock'][:, 0]
+
+    def clockSelection(self, beginClock, endClock, sensor='gps'):
+        """
+            selects the frames whose clock is in [beginClock, endClock[
+            frame clocks are assumed to increase along the file
+
+            :param beginClock: first clock value of the selection
+            :param endClock: last clock value of the selection
+            :param sensor: clock used for the selection
+
+            :return: telemetry file object containing the selection
+        """
+        # binary search: only the pages holding the probed frames are read
+        clock = self.frameClock(sensor)
+        first = bisect.bisect_left(clock, beginClock)
+        last = bisect.bisect_left(clock, endClock, lo=first)
+        return self[first:last]
+
+    def validity(self):
+        """
+            per-frame plausibility of the selected frames
+
+            :return: boolean array, True for plausible frames
+        """
+        return self.layout.validate(self.frames)
+
+    def slotValidity(self):
+        """
+            validity of the nominal frames of the whole file, i.e. of the frame
+            slots every frame size bytes from its start (not aligned with the
+            frames read once bytes were skipped): after resync, slots
+            overlapping skipped bytes are invalid, otherwise each slot is
+            checked for plausibility (see FrameLayout.validate)
+
+            :return: boolean array, one value per whole frame slot of the file
+        """
+        frameSize = self.layout.dtype.itemsize
+        if not self.resynced:
+            return self.layout.validate(_mapFrames(self.fileName, self.layout.dtype))
+        valid = np.ones(os.path.getsize(self.fileName) // frameSize, dtype=bool)
+        for (first, last) in self.skipped:
+            valid[first // frameSize:(last + frameSize - 1) // frameSize] = False
+        return valid
+
+    def read(self, perFrame=False):
+        """
+            decodes all the selected frames
+
+            :param perFrame: keep one row per frame (see FrameLayout.arrange)
+
+            :return: two dictionnaries, meas, clock
+        """
+        return self.layout.decode(self.frames, perFrame=perFrame)
+
+
+class TelemetryFollower(object):
+    """
+        incremental reader of a telemetry file still being written
+
+        remembers the offset of the last complete frame read, each poll
+        decodes only the whole frames appended since then
+    """
 
-def readTmFile(fileName, mode='mode1'):
+    def __init__(self, fileName, mode='mode1', offset=0):
+        """
+            constructor
+
+            :param fileName: telemetry file to follow
+            :param mode: frame layout of the file
+            :param offset: byte offset to start from (start of a frame)
+        """
+        self.fileName = fileName
+        self.mode = mode
+        self.layout = getLayout(mode)
+        self.offset = offset
+        self.nbFrames = 0
+
+    def poll(self, perFrame=False):
+        """
+            decodes the frames appended since the last poll
+            a trailing incomplete frame is left for the next poll
+
+            :param perFrame: keep one row per frame
+
+            :return: two dictionnaries, meas, clock (empty columns if nothing new)
+        """
+        frameSize = self.layout.dtype.itemsize
+        size = os.path.getsize(self.fileName)
+        if size < self.offset:
+            print("%s was truncated, reading it from the beginning" %self.fileName)
+            self.offset = 0
+
+        nbNew = (size - self.offset) // frameSize
+        buf = b''
+        if nbNew > 0:
+            with open(self.fileName, 'rb') as f:
+                f.seek(self.offset)
+                buf = f.read(nbNew * frameSize)
+        nbNew = len(buf) // frameSize
+
+        frames = np.frombuffer(buf, dtype=self.layout.dtype, count=nbNew)
+        self.offset += nbNew * frameSize
+        self.nbFrames += nbNew
+        return self.layout.decode(frames, perFrame=perFrame)
+
+
+def readTmFile(fileName, mode='mode1', cache=False, cacheDir=None, perFrame=False, resync=False, report=None):
     """
         reads data from a telemetry file
         returns two dictionnaries, meas, clock
         containing measurement and clock values
+
+        :param mode: frame layout (see FRAME_LAYOUTS), 'auto' to detect it from the file size
+        :param cache: if True, decoded columns are stored in (and read back from) a sidecar cache
+        :param cacheDir: directory of the caches (default: next to the telemetry file)
+        :param perFrame: if True, columns are (frames, samples) arrays, e.g. (frames, 18)
+                         for leddar values and clock in mode1, instead of flattened arrays
+        :param resync: if True, only plausible frames are kept, frame boundaries being
+                       searched again after corrupted bytes (see TelemetryFile)
+        :param report: optional dictionnary, filled with fileName -> {'skipped': list of
+                       skipped (first, last) byte ranges, 'offsets': byte offset of each
+                       frame read, 'validity': plausibility of each frame read (see
+                       TelemetryFile.validity), 'slots': validity of the nominal frame
+                       slots of the file (see TelemetryFile.slotValidity)}
     """
 
     print("reading telemetry file %s" %fileName)
-    # init of output dictionnaries
-    hdMeas = dict()
-    hdClock = dict()
-    for key in MEAS_KEYS:
-        hdMeas[key] = np.array([])
-    for key in CLOCK_KEYS:
-        hdClock[key] = np.array([])
 
-    # open the file
-    tmFile = open(fileName,"rb")
+    if mode == 'auto':
+        mode = detectMode(fileName)
+    layout = getLayout(mode)
+    version = layout.version
+    if resync:
+        version += '-resync'
+
+    if cache:
+        columns = readCache(fileName, 'telemetry', version, cacheDir=cacheDir)
+        if columns is not None:
+            print("using cache %s" %cachePath(fileName, 'telemetry', cacheDir))
+            if report is not None:
+                if 'report.slots' in columns:
+                    report[fileName] = {'skipped': [tuple(int(b) for b in r) for r in columns['report.skipped']],
+                        'offsets': np.array(columns['report.offsets']),
+                        'validity': np.array(columns['report.validity']),
+                        'slots': np.array(columns['report.slots'])}
+                else:
+                    report[fileName] = _fileReport(TelemetryFile(fileName, mode=mode, resync=resync))
+            return _splitColumns(columns, layout, perFrame)
+
+    tmFile = TelemetryFile(fileName, mode=mode, resync=resync)
+    (hdMeas, hdClock) = tmFile.read(perFrame=perFrame)
+    if report is not None:
+        report[fileName] = _fileReport(tmFile)
+
+    if cache:
+        columns = dict()
+        if resync:
+            # (the report of resynchronized files comes for free, keep it)
+            fileReport = _fileReport(tmFile)
+            columns['report.skipped'] = np.array(fileReport['skipped'], dtype=np.int64).reshape(-1, 2)
+            for key in ['offsets', 'validity', 'slots']:
+                columns['report.%s' %key] = fileReport[key]
+        for key in hdMeas.keys():
+            columns['meas.%s' %key] = hdMeas[key].ravel()
+        for key in hdClock.keys():
+            columns['clock.%s' %key] = hdClock[key].ravel()
+        try:
+            writeCache(fileName, 'telemetry', version, columns, cacheDir=cacheDir)
+        except (IOError, OSError) as e:
+            print("warning: cannot write cache %s (%s)" %(cachePath(fileName, 'telemetry', cacheDir), e))
+
+    for (first, last) in tmFile.skipped:
+        print("skipped bytes %s to %s" %(first, last))
+    print("read %s measures" %len(tmFile))
+    return (hdMeas, hdClock)
 
-    # read it depending on mode
-    if mode=='mode1':
 
-        Structure = "<dH5BI3fIfd4fdfIdfIdfIdfId12fdfIdfIdfIdfId12fd4fdfIdfIdfIdfId12fdfIdfIdfIdfId12fdfIdfI"
-        s = struct.Struct(Structure)
-        sizeMeas = struct.calcsize(Structure)
+def _fileReport(tmFile):
+    """
+        skipped byte ranges, frame offsets and validity of a telemetry file (see readTmFile)
+    """
+    return {'skipped': list(tmFile.skipped), 'offsets': tmFile.offsets, 'validity': tmFile.validity(),
+        'slots': tmFile.slotValidity()}
 
-        nbMeasure = 0
 
-        try:
-            while True:
-                measure = tmFile.read(sizeMeas)
-                if len(measure) != sizeMeas:
-                    break
-
-                # Recuperation des donnees
-                readMeasure = s.unpack(measure)
-
-                # GPS
-                hdClock['gps'] = np.append(hdClock['gps'], readMeasure[0])
-                hdMeas['year'] = np.append(hdMeas['year'], readMeasure[1])
-                hdMeas['month'] = np.append(hdMeas['month'], readMeasure[2])
-                hdMeas['day'] = np.append(hdMeas['day'], readMeasure[3])
-                hdMeas['hour'] = np.append(hdMeas['hour'], readMeasure[4])
-                hdMeas['min'] = np.append(hdMeas['min'], readMeasure[5])
-                hdMeas['sec'] = np.append(hdMeas['sec'], readMeasure[6])
-                hdMeas['usec'] = np.append(hdMeas['usec'], readMeasure[7])
-                hdMeas['gps_lat'] = np.append(hdMeas['gps_lat'], readMeasure[8])
-                hdMeas['gps_lon'] = np.append(hdMeas['gps_lon'], readMeasure[9])
-                hdMeas['gps_geoidheight'] = np.append(hdMeas['gps_geoidheight'], readMeasure[10])
-                hdMeas['gps_nbsat'] = np.append(hdMeas['gps_nbsat'], readMeasure[11])
-                hdMeas['gps_altitude'] = np.append(hdMeas['gps_altitude'], readMeasure[12])
-                # 1 baro
-                hdClock['baro'] = np.append(hdClock['baro'], readMeasure[13])
-                hdMeas['baro_pressure'] = np.append(hdMeas['baro_pressure'], readMeasure[14])
-                hdMeas['baro_sea_level_pressure'] = np.append(hdMeas['baro_sea_level_pressure'], readMeasure[15])
-                hdMeas['baro_altitude'] = np.append(hdMeas['baro_altitude'], readMeasure[16])
-                hdMeas['baro_temperature'] = np.append(hdMeas['baro_temperature'], readMeasure[17])
-                # 4 leddar measurements
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[18])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[19])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[20])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[21])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[22])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[23])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[24])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[25])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[26])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[27])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[28])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[29])
-                # 1 IMU
-                hdClock['imu'] = np.append(hdClock['imu'], readMeasure[30])
-                hdMeas['imu_pitch_angle'] = np.append(hdMeas['imu_pitch_angle'], readMeasure[31])
-                hdMeas['imu_roll_angle'] = np.append(hdMeas['imu_roll_angle'], readMeasure[32])
-                hdMeas['imu_yaw_angle'] = np.append(hdMeas['imu_yaw_angle'], readMeasure[33])
-                hdMeas['imu_accel_x'] = np.append(hdMeas['imu_accel_x'], readMeasure[34])
-                hdMeas['imu_accel_y'] = np.append(hdMeas['imu_accel_y'], readMeasure[35])
-                hdMeas['imu_accel_z'] = np.append(hdMeas['imu_accel_z'], readMeasure[36])
-                hdMeas['imu_linear_accel_x'] = np.append(hdMeas['imu_linear_accel_x'], readMeasure[37])
-                hdMeas['imu_linear_accel_y'] = np.append(hdMeas['imu_linear_accel_y'], readMeasure[38])
-                hdMeas['imu_linear_accel_z'] = np.append(hdMeas['imu_linear_accel_z'], readMeasure[39])
-                hdMeas['imu_grav_accel_x'] = np.append(hdMeas['imu_grav_accel_x'], readMeasure[40])
-                hdMeas['imu_grav_accel_y'] = np.append(hdMeas['imu_grav_accel_y'], readMeasure[41])
-                hdMeas['imu_grav_accel_z'] = np.append(hdMeas['imu_grav_accel_z'], readMeasure[42])
-                # 4 leddar measurements
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[43])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[44])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[45])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[46])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[47])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[48])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[49])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[50])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[51])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[52])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[53])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[54])
-                # 1 IMU
-                hdClock['imu'] = np.append(hdClock['imu'], readMeasure[55])
-                hdMeas['imu_pitch_angle'] = np.append(hdMeas['imu_pitch_angle'], readMeasure[56])
-                hdMeas['imu_roll_angle'] = np.append(hdMeas['imu_roll_angle'], readMeasure[57])
-                hdMeas['imu_yaw_angle'] = np.append(hdMeas['imu_yaw_angle'], readMeasure[58])
-                hdMeas['imu_accel_x'] = np.append(hdMeas['imu_accel_x'], readMeasure[59])
-                hdMeas['imu_accel_y'] = np.append(hdMeas['imu_accel_y'], readMeasure[60])
-                hdMeas['imu_accel_z'] = np.append(hdMeas['imu_accel_z'], readMeasure[61])
-                hdMeas['imu_linear_accel_x'] = np.append(hdMeas['imu_linear_accel_x'], readMeasure[62])
-                hdMeas['imu_linear_accel_y'] = np.append(hdMeas['imu_linear_accel_y'], readMeasure[63])
-                hdMeas['imu_linear_accel_z'] = np.append(hdMeas['imu_linear_accel_z'], readMeasure[64])
-                hdMeas['imu_grav_accel_x'] = np.append(hdMeas['imu_grav_accel_x'], readMeasure[65])
-                hdMeas['imu_grav_accel_y'] = np.append(hdMeas['imu_grav_accel_y'], readMeasure[66])
-                hdMeas['imu_grav_accel_z'] = np.append(hdMeas['imu_grav_accel_z'], readMeasure[67])
-                # 1 baro
-                hdClock['baro'] = np.append(hdClock['baro'], readMeasure[68])
-                hdMeas['baro_pressure'] = np.append(hdMeas['baro_pressure'], readMeasure[69])
-                hdMeas['baro_sea_level_pressure'] = np.append(hdMeas['baro_sea_level_pressure'], readMeasure[70])
-                hdMeas['baro_altitude'] = np.append(hdMeas['baro_altitude'], readMeasure[71])
-                hdMeas['baro_temperature'] = np.append(hdMeas['baro_temperature'], readMeasure[72])
-                # 4 leddar measurements
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[73])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[74])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[75])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[76])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[77])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[78])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[79])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[80])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[81])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[82])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[83])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[84])
-                # 1 IMU
-                hdClock['imu'] = np.append(hdClock['imu'], readMeasure[85])
-                hdMeas['imu_pitch_angle'] = np.append(hdMeas['imu_pitch_angle'], readMeasure[86])
-                hdMeas['imu_roll_angle'] = np.append(hdMeas['imu_roll_angle'], readMeasure[87])
-                hdMeas['imu_yaw_angle'] = np.append(hdMeas['imu_yaw_angle'], readMeasure[88])
-                hdMeas['imu_accel_x'] = np.append(hdMeas['imu_accel_x'], readMeasure[89])
-                hdMeas['imu_accel_y'] = np.append(hdMeas['imu_accel_y'], readMeasure[90])
-                hdMeas['imu_accel_z'] = np.append(hdMeas['imu_accel_z'], readMeasure[91])
-                hdMeas['imu_linear_accel_x'] = np.append(hdMeas['imu_linear_accel_x'], readMeasure[92])
-                hdMeas['imu_linear_accel_y'] = np.append(hdMeas['imu_linear_accel_y'], readMeasure[93])
-                hdMeas['imu_linear_accel_z'] = np.append(hdMeas['imu_linear_accel_z'], readMeasure[94])
-                hdMeas['imu_grav_accel_x'] = np.append(hdMeas['imu_grav_accel_x'], readMeasure[95])
-                hdMeas['imu_grav_accel_y'] = np.append(hdMeas['imu_grav_accel_y'], readMeasure[96])
-                hdMeas['imu_grav_accel_z'] = np.append(hdMeas['imu_grav_accel_z'], readMeasure[97])
-                # 4 leddar measurements
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[98])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[99])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[100])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[101])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[102])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[103])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[104])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[105])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[106])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[107])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[108])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[109])
-                # 1 IMU
-                hdClock['imu'] = np.append(hdClock['imu'], readMeasure[110])
-                hdMeas['imu_pitch_angle'] = np.append(hdMeas['imu_pitch_angle'], readMeasure[111])
-                hdMeas['imu_roll_angle'] = np.append(hdMeas['imu_roll_angle'], readMeasure[112])
-                hdMeas['imu_yaw_angle'] = np.append(hdMeas['imu_yaw_angle'], readMeasure[113])
-                hdMeas['imu_accel_x'] = np.append(hdMeas['imu_accel_x'], readMeasure[114])
-                hdMeas['imu_accel_y'] = np.append(hdMeas['imu_accel_y'], readMeasure[115])
-                hdMeas['imu_accel_z'] = np.append(hdMeas['imu_accel_z'], readMeasure[116])
-                hdMeas['imu_linear_accel_x'] = np.append(hdMeas['imu_linear_accel_x'], readMeasure[117])
-                hdMeas['imu_linear_accel_y'] = np.append(hdMeas['imu_linear_accel_y'], readMeasure[118])
-                hdMeas['imu_linear_accel_z'] = np.append(hdMeas['imu_linear_accel_z'], readMeasure[119])
-                hdMeas['imu_grav_accel_x'] = np.append(hdMeas['imu_grav_accel_x'], readMeasure[120])
-                hdMeas['imu_grav_accel_y'] = np.append(hdMeas['imu_grav_accel_y'], readMeasure[121])
-                hdMeas['imu_grav_accel_z'] = np.append(hdMeas['imu_grav_accel_z'], readMeasure[122])
-                # 2 leddar measurements
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[123])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[124])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[125])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[126])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[127])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[128])
-
-                nbMeasure += 1
-
-        except IOError:
-            print("Erreur de lecture de la mesure")
-            pass
-
-    elif mode=='mode2':
-        Structure = "<"
-        s = struct.Struct(Structure)
-        sizeMeas = struct.calcsize(Structure)
-
-        nbMeasure = 0
-        try:
-            while True:
-                measure = tmFile.read(sizeMeas)
-                if len(measure) != sizeMeas:
-                    break
-
-                # Recuperation des donnees
-                readMeasure = s.unpack(measure)
-
-                # GPS
-                hdClock['gps'] = np.append(hdClock['gps'], readMeasure[0])
-                hdMeas['year'] = np.append(hdMeas['year'], readMeasure[1])
-                hdMeas['month'] = np.append(hdMeas['month'], readMeasure[2])
-                hdMeas['day'] = np.append(hdMeas['day'], readMeasure[3])
-                hdMeas['hour'] = np.append(hdMeas['hour'], readMeasure[4])
-                hdMeas['min'] = np.append(hdMeas['min'], readMeasure[5])
-                hdMeas['sec'] = np.append(hdMeas['sec'], readMeasure[6])
-                hdMeas['usec'] = np.append(hdMeas['usec'], readMeasure[7])
-                hdMeas['gps_lat'] = np.append(hdMeas['gps_lat'], readMeasure[8])
-                hdMeas['gps_lon'] = np.append(hdMeas['gps_lon'], readMeasure[9])
-                hdMeas['gps_geoidheight'] = np.append(hdMeas['gps_geoidheight'], readMeasure[10])
-                hdMeas['gps_nbsat'] = np.append(hdMeas['gps_nbsat'], readMeasure[11])
-                hdMeas['gps_altitude'] = np.append(hdMeas['gps_altitude'], readMeasure[12])
-                # 8 leddar measurements
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[12])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[14])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[15])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[16])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[17])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[18])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[19])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[20])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[21])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[22])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[23])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[24])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[25])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[26])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[27])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[28])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[29])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[30])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[31])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[32])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[33])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[34])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[35])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[36])
-                # 1 baro
-                hdClock['baro'] = np.append(hdClock['baro'], readMeasure[37])
-                hdMeas['baro_pressure'] = np.append(hdMeas['baro_pressure'], readMeasure[38])
-                hdMeas['baro_sea_level_pressure'] = np.append(hdMeas['baro_sea_level_pressure'], readMeasure[39])
-                hdMeas['baro_altitude'] = np.append(hdMeas['baro_altitude'], readMeasure[40])
-                hdMeas['baro_temperature'] = np.append(hdMeas['baro_temperature'], readMeasure[41])
-                # 8 leddar measurements
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[42])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[43])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[44])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[45])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[46])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[47])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[48])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[49])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[50])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[51])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[52])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[53])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[54])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[55])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[56])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[57])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[58])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[59])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[60])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[61])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[62])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[63])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[64])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[65])
-                # 1 IMU
-                hdClock['imu'] = np.append(hdClock['imu'], readMeasure[66])
-                hdMeas['imu_pitch_angle'] = np.append(hdMeas['imu_pitch_angle'], readMeasure[67])
-                hdMeas['imu_roll_angle'] = np.append(hdMeas['imu_roll_angle'], readMeasure[68])
-                hdMeas['imu_yaw_angle'] = np.append(hdMeas['imu_yaw_angle'], readMeasure[69])
-                hdMeas['imu_accel_x'] = np.append(hdMeas['imu_accel_x'], readMeasure[70])
-                hdMeas['imu_accel_y'] = np.append(hdMeas['imu_accel_y'], readMeasure[71])
-                hdMeas['imu_accel_z'] = np.append(hdMeas['imu_accel_z'], readMeasure[72])
-                hdMeas['imu_linear_accel_x'] = np.append(hdMeas['imu_linear_accel_x'], readMeasure[73])
-                hdMeas['imu_linear_accel_y'] = np.append(hdMeas['imu_linear_accel_y'], readMeasure[74])
-                hdMeas['imu_linear_accel_z'] = np.append(hdMeas['imu_linear_accel_z'], readMeasure[75])
-                hdMeas['imu_grav_accel_x'] = np.append(hdMeas['imu_grav_accel_x'], readMeasure[76])
-                hdMeas['imu_grav_accel_y'] = np.append(hdMeas['imu_grav_accel_y'], readMeasure[77])
-                hdMeas['imu_grav_accel_z'] = np.append(hdMeas['imu_grav_accel_z'], readMeasure[78])
-                # 8 leddar measurements
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[79])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[80])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[81])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[82])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[83])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[84])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[85])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[86])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[87])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[88])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[89])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[90])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[91])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[92])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[93])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[94])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[95])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[96])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[97])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[98])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[99])
-                hdClock['leddar'] = np.append(hdClock['leddar'], readMeasure[100])
-                hdMeas['leddar_range'] = np.append(hdMeas['leddar_range'], readMeasure[101])
-                hdMeas['leddar_amplitude'] = np.append(hdMeas['leddar_amplitude'], readMeasure[102])
-
-                nbMeasure += 1
-
-        except IOError:
-            print("Erreur de lecture de la mesure")
-            pass
+def _readTmFileReport(fileName, **kwargs):
+    """
+        readTmFile returning the report of the file with the data
+        (for readTmDirectory, worker processes cannot fill the caller report)
 
-    else:
-        raise Exception("mode %s is unknown")
+        :return: meas, clock, report of the file
+    """
+    report = dict()
+    (meas, clock) = readTmFile(fileName, report=report, **kwargs)
+    return (meas, clock, report[fileName])
 
-    print("read %s measures" %nbMeasure)
-    return (hdMeas, hdClock)
+
+def _splitColumns(columns, layout, perFrame=False):
+    """
+        splits cached (flattened) columns back into meas, clock dictionnaries
+    """
+    meas = dict()
+    clock = dict()
+    for name in columns.keys():
+        (kind, key) = name.split('.', 1)
+        if kind == 'report':
+            continue
+        if kind == 'meas':
+            sensor = layout.sensorOf(key)
+            output = meas
+        else:
+            sensor = key
+            output = clock
+        values = columns[name].reshape(-1, layout.samplesPerFrame(sensor))
+        output[key] = layout.arrange(values, perFrame=perFrame)
+    return (meas, clock)
 
 
-def readTmDirectory(directory, pattern='*', mode='mode1'):
+def readTmDirectory(directory, pattern='*', mode='mode1', workers=None, cache=False, cacheDir=None,
+        perFrame=False, resync=False, report=None):
     """
         reads all telemetry files mathcing pattern in directory
+
+        :param workers: number of processes decoding files concurrently
+                        (default None reads the files one after another)
+        :param cache: use the sidecar caches of the files (see readTmFile)
+        :param cacheDir: directory of the caches
+        :param perFrame: keep one row per frame (see readTmFile)
+        :param resync: keep only plausible frames (see readTmFile)
+        :param report: optional dictionnary, filled with the report of each file (see readTmFile)
     """
 
     print("reading telemetry files from %s" %directory)
 
-    # init of output dictionnaries
+    # list of files to read
+    print("looking for files matching %s" %pattern)
+    # (sidecar cache directories are skipped)
+    listFile = [f for f in sorted(glob.glob("%s/%s" %(directory, pattern))) if os.path.isfile(f)]
+    print("%s files were found" %len(listFile))
+
+    # decode all files, results are kept in the sorted file order
+    readFile = functools.partial(readTmFile if report is None else _readTmFileReport, mode=mode,
+        cache=cache, cacheDir=cacheDir, perFrame=perFrame, resync=resync)
+    if workers is not None and workers > 1 and len(listFile) > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(readFile, listFile)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [readFile(fileName) for fileName in listFile]
+    if report is not None:
+        for (fileName, result) in zip(listFile, results):
+            report[fileName] = result[2]
+        results = [result[:2] for result in results]
+
+    # a single concatenation per column
     meas = dict()
     clock = dict()
     for key in MEAS_KEYS:
         meas[key] = np.array([])
+        if len(results) > 0:
+            meas[key] = np.concatenate([currentMeas[key] for (currentMeas, _) in results])
     for key in CLOCK_KEYS:
         clock[key] = np.array([])
+        if len(results) > 0:
+            clock[key] = np.concatenate([currentClock[key] for (_, currentClock) in results])
+
+    return (meas, clock)
+
+
+def iterTmDirectory(directory, pattern='*', mode='mode1', chunkFrames=100000, perFrame=False):
+    """
+        iterates over all telemetry files matching pattern in directory
+        by blocks of chunkFrames frames, blocks may span several files
+
+        :param directory: directory to read tm files from
+        :param pattern: pattern to select tm files
+        :param mode: frame layout of the files
+        :param chunkFrames: number of frames per block (the last one may be shorter)
+        :param perFrame: keep one row per frame (see readTmFile)
+
+        :return: generator of (meas, clock) dictionnaries
+    """
+
+    print("reading telemetry files from %s" %directory)
 
     # list of files to read
     print("looking for files matching %s" %pattern)
-    listFile = sorted(glob.glob("%s/%s" %(directory, pattern)))
+    # (sidecar cache directories are skipped)
+    listFile = [f for f in sorted(glob.glob("%s/%s" %(directory, pattern))) if os.path.isfile(f)]
     print("%s files were found" %len(listFile))
 
-    # loop through all files
-    for fileName in listFile:
-        currentMeas, currentClock = readTmFile(fileName, mode=mode)
-
-        # append to the dictionnaries
-        for key in MEAS_KEYS:
-            meas[key] = np.append(meas[key], currentMeas[key])
-        for key in CLOCK_KEYS:
-            clock[key] = np.append(clock[key], currentClock[key])
+    # selections waiting to fill the current block
+    pending = []
+    nbPending = 0
 
+    for fileName in listFile:
+        tmFile = TelemetryFile(fileName, mode=mode)
+        first = 0
+        while first < len(tmFile):
+            last = min(len(tmFile), first + chunkFrames - nbPending)
+            pending.append(tmFile[first:last])
+            nbPending += last - first
+            first = last
+            if nbPending == chunkFrames:
+                yield _decodeSelections(pending, perFrame)
+                pending = []
+                nbPending = 0
+
+    if nbPending > 0:
+        yield _decodeSelections(pending, perFrame)
+
+
+def _decodeSelections(selections, perFrame=False):
+    """
+        decodes several telemetry file selections into a single block
+        (files may have different layouts)
+    """
+    decoded = [selection.read(perFrame=perFrame) for selection in selections]
+    meas = dict()
+    clock = dict()
+    for key in decoded[0][0].keys():
+        meas[key] = np.concatenate([currentMeas[key] for (currentMeas, _) in decoded])
+    for key in decoded[0][1].keys():
+        clock[key] = np.concatenate([currentClock[key] for (_, currentClock) in decoded])
     return (meas, clock)
@@ -0,0 +1,599 @@
+#!/usr/bin/env python
+#
+
+'''
+    filters of sampled series
+'''
+
+import heapq
+import multiprocessing
+import numpy as np
+
+# kernels longer than this are convolved by FFT
+DIRECT_CONVOLUTION_MAX = 48
+
+# number of (point, neighbour) pairs weighted at once by lowess
+LOWESS_BLOCK = 2000000
+
+
+#===============================================================================
+# running median
+class _MedianHeaps:
+    '''
+    multiset of values split in two heaps around its median: a max heap of
+    the lower half and a min heap of the upper half, removed values are
+    only discarded when they reach the top of a heap
+    '''
+
+    def __init__(self):
+        self.low = []
+        self.high = []
+        self.lowSize = 0
+        self.highSize = 0
+        self.delayed = dict()
+
+    def _prune(self, heap, sign):
+        '''
+            pops the removed values from the top of a heap
+        '''
+        while heap:
+            value = sign * heap[0]
+            count = self.delayed.get(value, 0)
+            if count == 0:
+                break
+            if count == 1:
+                del self.delayed[value]
+            else:
+                self.delayed[value] = count - 1
+            heapq.heappop(heap)
+
+    def _balance(self):
+        '''
+            keeps lowSize equal to highSize or highSize + 1
+        '''
+        if self.lowSize > self.highSize + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.lowSize -= 1
+            self.highSize += 1
+            self._prune(self.low, -1)
+        elif self.lowSize < self.highSize:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.lowSize += 1
+            self.highSize -= 1
+            self._prune(self.high, 1)
+
+    def _compact(self):
+        '''
+            drops all removed values once they outnumber the kept ones
+        '''
+        delayed = self.delayed
+        for (heap, sign) in [(self.low, -1), (self.high, 1)]:
+            kept = []
+            for entry in heap:
+                count = delayed.get(sign * entry, 0)
+                if count > 0:
+                    delayed[sign * entry] = count - 1
+                else:
+                    kept.append(entry)
+            heapq.heapify(kept)
+            heap[:] = kept
+        self.delayed = dict()
+
+    def add(self, value):
+        if self.lowSize == 0 or value <= -self.low[0]:
+            heapq.heappush(self.low, -value)
+            self.lowSize += 1
+        else:
+            heapq.heappush(self.high, value)
+            self.highSize += 1
+        self._balance()
+
+    def remove(self, value):
+        self.delayed[value] = self.delayed.get(value, 0) + 1
+        if value <= -self.low[0]:
+            self.lowSize -= 1
+            if value == -self.low[0]:
+                self._prune(self.low, -1)
+        else:
+            self.highSize -= 1
+            if value == self.high[0]:
+                self._prune(self.high, 1)
+        self._balance()
+        if len(self.low) + len(self.high) > 2 * (self.lowSize + self.highSize) + 64:
+            self._compact()
+
+    def median(self):
+        if self.lowSize == 0:
+            return np.nan
+        if self.lowSize > self.highSize:
+            return -self.low[0]
+        return 0.5 * (self.high[0] - self.low[0])
+
+
+def runningMedian(values, first, last):
+    '''
+        medians of values over sliding windows, NaNs are ignored
+        (O(n log k) time, O(k) memory for windows of k values)
+
+        :param values: 1D array
+        :param first: first index of each window
+        :param last: last index (excluded) of each window, both bounds must
+                     be non decreasing and first <= last
+
+        :return: array of the medians (NaN for windows without valid value)
+    '''
+    values = np.asarray(values, dtype=np.float64).tolist()
+    first = np.asarray(first, dtype=np.int64).tolist()
+    last = np.asarray(last, dtype=np.int64).tolist()
+    out = np.empty(len(first))
+
+    heaps = _MedianHeaps()
+    start = 0
+    end = 0
+    for i in range(len(first)):
+        # values entering then leaving the window
+        while end < last[i]:
+            value = values[end]
+            if value == value:
+                heaps.add(value)
+            end += 1
+        while start < first[i]:
+            value = values[start]
+            if value == value:
+                heaps.remove(value)
+            start += 1
+        out[i] = heaps.median()
+    return out
+
+
+def medianFilter(values, window):
+    '''
+        centered running median over window samples, the series is
+        extended by repeating its end values
+
+        :param values: 1D array
+        :param window: number of samples of the window (odd or even)
+
+        :return: array of the filtered values
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    window = int(window)
+    if values.ndim != 1:
+        raise Exception("median filter input must be one-dimensional")
+    if window < 1:
+        raise Exception("median filter window must be at least one sample")
+    if len(values) == 0:
+        return values.copy()
+
+    # (even windows have one more sample before than after)
+    before = window // 2
+    after = window - 1 - before
+    padded = np.concatenate([np.repeat(values[:1], before), values, np.repeat(values[-1:], after)])
+    first = np.arange(len(values))
+    return runningMedian(padded, first, first + window)
+#===============================================================================
+
+#===============================================================================
+# running statistics
+def sampleWindows(n, window):
+    '''
+        bounds of the centered windows of window samples of a series of n
+        values, truncated at the ends of the series
+
+        :return: (first, last) arrays, last excluded
+    '''
+    window = max(int(window), 1)
+    index = np.arange(n)
+    first = np.maximum(index - window // 2, 0)
+    last = np.minimum(index - window // 2 + window, n)
+    return (first, last)
+
+def timeWindows(x, width):
+    '''
+        bounds of the windows of width (abscissa units, e.g. seconds)
+        centered on each value of x
+
+        :param x: increasing abscissae
+        :param width: width of the windows
+
+        :return: (first, last) arrays, last excluded
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    if np.any(x[1:] < x[:-1]):
+        raise Exception("time windows need increasing times")
+    first = np.searchsorted(x, x - width / 2., side='left')
+    last = np.searchsorted(x, x + width / 2., side='right')
+    return (first, last)
+
+def runningMean(values, first, last):
+    '''
+        mean of values over windows, NaNs are ignored (cumulative sums, O(n))
+
+        :param values: 1D array or stack of columns of shape (k, n)
+        :param first: first index of each window
+        :param last: last index (excluded) of each window
+
+        :return: array of the means, NaN for windows without valid value
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    zeroed = np.where(valid, values, 0.)
+    center = zeroed.sum(axis=-1, keepdims=True) / np.maximum(valid.sum(axis=-1, keepdims=True), 1)
+    sums = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+    np.cumsum(np.where(valid, zeroed - center, 0.), axis=-1, out=sums[..., 1:])
+    counts = np.zeros(sums.shape, dtype=np.int64)
+    np.cumsum(valid, axis=-1, out=counts[..., 1:])
+
+    count = np.take(counts, last, axis=-1) - np.take(counts, first, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (np.take(sums, last, axis=-1) - np.take(sums, first, axis=-1)) / count
+    return np.where(count > 0, mean + center, np.nan)
+
+def runningMeanStd(values, first, last):
+    '''
+        mean and standard deviation of values over windows, NaNs are
+        ignored (cumulative sums, O(n))
+
+        :param values: 1D array
+        :param first: first index of each window
+        :param last: last index (excluded) of each window
+
+        :return: (mean, std) arrays, NaN for windows with less than two valid values
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.isfinite(values)
+    # centered values keep the precision of the sums
+    center = values[valid].mean() if valid.any() else 0.
+    centered = np.where(valid, values - center, 0.)
+    sums = np.concatenate([[0.], np.cumsum(centered)])
+    squares = np.concatenate([[0.], np.cumsum(centered**2)])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+
+    count = (counts[last] - counts[first]).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (sums[last] - sums[first]) / count
+        variance = (squares[last] - squares[first]) / count - mean**2
+    std = np.sqrt(np.maximum(variance, 0.))
+    mean[count < 2] = np.nan
+    std[count < 2] = np.nan
+    return (mean + center, std)
+#===============================================================================
+
+#===============================================================================
+# convolution
+_lanczosKernels = dict()
+
+def lanczosKernel(window, cutoff):
+    '''
+        lanczos filter weights, computed once per (window, cutoff)
+
+        :param window: width of the filter (samples)
+        :param cutoff: cutoff frequency (cycles per sample)
+
+        :return: read-only array of an odd number of weights
+    '''
+    if (window, cutoff) not in _lanczosKernels:
+        order = int((window - 1) // 2 ) + 1
+        nwts = 2 * order + 1
+        w = np.zeros([nwts])
+        n = nwts // 2
+        w[n] = 2 * cutoff
+        k = np.arange(1., n)
+        sigma = np.sin(np.pi * k / n) * n / (np.pi * k)
+        firstfactor = np.sin(2. * np.pi * cutoff * k) / (np.pi * k)
+        w[n-1:0:-1] = firstfactor * sigma
+        w[n+1:-1] = firstfactor * sigma
+        kernel = w[1:-1]
+        kernel.setflags(write=False)
+        _lanczosKernels[(window, cutoff)] = kernel
+    return _lanczosKernels[(window, cutoff)]
+
+def boxKernel(width):
+    '''
+        box filter weights, as astropy Box1DKernel: an odd number of samples,
+        the end samples are weighted by the fraction of the box they cover
+        (e.g. width 10 gives 11 weights, 0.5 at both ends)
+
+        :param width: width of the box (samples)
+    '''
+    if width <= 0:
+        raise Exception("box width must be positive")
+    size = int(np.ceil(width))
+    if size % 2 == 0:
+        size += 1
+    x = np.arange(size) - size // 2
+    inside = lambda edge: (np.abs(edge) <= width / 2.).astype(np.float64)
+    kernel = 0.5 * (inside(x - 0.5) + inside(x + 0.5))
+    return kernel / kernel.sum()
+
+def timeLanczos(values, x, window, cutoff):
+    '''
+        lanczos filter of series sampled at irregular times: the series are
+        linearly resampled on a uniform grid of the same number of samples,
+        filtered, then interpolated back
+
+        :param values: 1D array or stack of columns of shape (k, n)
+        :param x: increasing times of the samples (seconds)
+        :param window: width of the filter (seconds)
+        :param cutoff: cutoff frequency (Hz)
+
+        :return: array of the same shape as values
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    stack = np.atleast_2d(values)
+    n = len(x)
+    if n < 2 or x[-1] <= x[0]:
+        return values.copy()
+
+    step = (x[-1] - x[0]) / (n - 1)
+    grid = x[0] + np.arange(n) * step
+    resampled = np.full(stack.shape, np.nan)
+    for (i, column) in enumerate(stack):
+        valid = np.isfinite(column)
+        if valid.any():
+            resampled[i] = np.interp(grid, x[valid], column[valid])
+
+    kernel = lanczosKernel(max(int(round(window / step)), 1), cutoff * step)
+    filtered = convolve(resampled, kernel)
+    out = np.vstack([np.interp(x, grid, column) for column in filtered])
+    return out.reshape(values.shape)
+
+def _convolveFull(values, kernel):
+    '''
+        full convolution of each row of values with kernel
+        (direct for short kernels, overlap-add FFT for long ones)
+    '''
+    n = values.shape[-1]
+    w = len(kernel)
+    if w <= DIRECT_CONVOLUTION_MAX:
+        out = np.zeros(values.shape[:-1] + (n + w - 1,))
+        for (j, weight) in enumerate(kernel):
+            out[..., j:j+n] += weight * values
+        return out
+
+    # blocks of L samples, transforms of N >= L + w - 1 samples, so that each
+    # block only overlaps the following one
+    nfft = 1 << int(np.ceil(np.log2(8 * w)))
+    L = nfft - w + 1
+    nbBlocks = -(-n // L)
+    blocks = np.zeros(values.shape[:-1] + (nbBlocks * L,))
+    blocks[..., :n] = values
+    blocks = blocks.reshape(values.shape[:-1] + (nbBlocks, L))
+    spectrum = np.fft.rfft(blocks, n=nfft, axis=-1) * np.fft.rfft(kernel, n=nfft)
+    y = np.fft.irfft(spectrum, n=nfft, axis=-1)
+
+    # overlap-add of the tails on the next blocks
+    out = np.zeros(values.shape[:-1] + (nbBlocks + 1, L))
+    out[..., :-1, :] = y[..., :L]
+    out[..., 1:, :w-1] += y[..., L:]
+    out = out.reshape(values.shape[:-1] + ((nbBlocks + 1) * L,))
+    return out[..., :n + w - 1]
+
+def convolve(values, kernel):
+    '''
+        convolution of series with an odd kernel, normalized by the sum of
+        the weights on valid samples: NaNs are ignored and replaced by the
+        weighted mean of their neighbours, series are extended by repeating
+        their end values (as astropy convolve with boundary='extend')
+
+        :param values: 1D array, or stack of k columns of shape (k, n)
+        :param kernel: odd number of weights
+
+        :return: array of the same shape as values
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    kernel = np.asarray(kernel, dtype=np.float64)
+    if len(kernel) % 2 == 0:
+        raise Exception("convolution kernel must have an odd size")
+    if values.shape[-1] == 0:
+        return values.copy()
+
+    # series extended by their end values
+    half = len(kernel) // 2
+    padded = np.concatenate([np.repeat(values[..., :1], half, axis=-1), values,
+        np.repeat(values[..., -1:], half, axis=-1)], axis=-1)
+    valid = np.isfinite(padded)
+    n = values.shape[-1]
+
+    if valid.all():
+        out = _convolveFull(padded, kernel)[..., 2*half:2*half+n]
+        return out / kernel.sum()
+
+    # filtered values and weights in the same pass
+    stack = np.stack([np.where(valid, padded, 0.), valid.astype(np.float64)])
+    out = _convolveFull(stack, kernel)[..., 2*half:2*half+n]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        filtered = out[0] / out[1]
+    # (no valid value under the kernel)
+    filtered[np.abs(out[1]) < 1e-12 * np.abs(kernel).sum()] = np.nan
+    return filtered
+#===============================================================================
+
+#===============================================================================
+# lowess
+def _nearestWindows(x, points, k):
+    '''
+        first index of the window of the k nearest neighbours of each point
+        (x must be sorted), by bisection on all points at once
+    '''
+    n = len(x)
+    lo = np.clip(points - k + 1, 0, n - k)
+    hi = np.clip(points, 0, n - k)
+    xi = x[points]
+    while np.any(lo < hi):
+        # the window moves right while its next value is closer than its first one
+        mid = (lo + hi) // 2
+        active = lo < hi
+        moveRight = x[np.minimum(mid + k, n - 1)] - xi < xi - x[mid]
+        lo = np.where(active & moveRight, mid + 1, lo)
+        hi = np.where(active & ~moveRight, mid, hi)
+    return lo
+
+def _lowessFit(x, y, weights, left, count, radius, points):
+    '''
+        local linear fits at x[points] on the windows [left, left + count),
+        weighted by tricube distances (relative to radius) and robustness weights
+    '''
+    width = count.max()
+    offsets = np.arange(width)
+    index = np.minimum(left[:, np.newaxis] + offsets, len(x) - 1)
+    xi = x[points]
+    # abscissae relative to the fitted points
+    u = x[index]
+    u -= xi[:, np.newaxis]
+    yj = y[index]
+    with np.errstate(divide='ignore'):
+        scale = np.where(radius > 0, 1. / radius, 0.)
+
+    # tricube weights of the distances (none outside the windows)
+    w = np.abs(u)
+    w *= scale[:, np.newaxis]
+    np.power(w, 3, out=w)
+    np.subtract(1., w, out=w)
+    np.clip(w, 0., 1., out=w)
+    np.power(w, 3, out=w)
+    w *= weights[index]
+    w[offsets >= count[:, np.newaxis]] = 0.
+
+    total = w.sum(axis=1)
+    nonzero = np.count_nonzero(w > 1e-12, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w /= total[:, np.newaxis]
+        meanU = np.einsum('ij,ij->i', w, u)
+        u -= meanU[:, np.newaxis]
+        # (floored as statsmodels: close abscissae give a flat fit)
+        spread = np.maximum(np.einsum('ij,ij,ij->i', w, u, u), 1e-12)
+        yj *= w
+        fit = yj.sum(axis=1)
+        slope = np.einsum('ij,ij->i', yj, u) / spread
+    fit -= meanU * slope
+    # (a single neighbour with a non zero weight, or a window of tied
+    # abscissae, keeps the value)
+    return np.where((nonzero > 1) & (radius > 0), fit, y[points])
+
+def _lowessChunk(args):
+    '''
+        lowess fits of a chunk of points, by blocks of about LOWESS_BLOCK pairs
+    '''
+    (x, y, weights, left, count, radius, points) = args
+    fits = []
+    i = 0
+    while i < len(points):
+        # (blocks are sized on the widest window they hold)
+        step = max(LOWESS_BLOCK // max(count[i], 1), 1)
+        while step > 1 and count[i:i+step].max() * step > 2 * LOWESS_BLOCK:
+            step //= 2
+        fits.append(_lowessFit(x, y, weights, left[i:i+step], count[i:i+step], radius[i:i+step],
+            points[i:i+step]))
+        i += step
+    if len(fits) == 0:
+        return np.array([])
+    return np.concatenate(fits)
+
+def _lowessPoints(x, delta):
+    '''
+        indices of the points fitted by lowess (statsmodels rule): after a
+        fitted point, the next one is the last point within delta of it, or
+        the point following its ties; tied points share the fit of the first one
+    '''
+    n = len(x)
+    if delta <= 0:
+        return np.flatnonzero(np.r_[True, x[1:] != x[:-1]])
+    tieEnds = np.searchsorted(x, x, side='right') - 1
+    cuts = np.minimum(np.searchsorted(x, x + delta, side='right'), n - 1)
+    points = [0]
+    while tieEnds[points[-1]] < n - 1:
+        i = points[-1]
+        points.append(max(cuts[i] - 1, tieEnds[i] + 1))
+    return np.array(points)
+
+def lowess(values, x, window, iterations=3, delta=0., workers=None, span=None):
+    '''
+        locally weighted linear regression (as statsmodels lowess): each
+        value is fitted on its window nearest neighbours with tricube
+        weights, then the fits are repeated with bisquare robustness weights
+        on the residuals
+
+        :param values: 1D array (NaNs are left out and get NaN)
+        :param x: abscissae of the values
+        :param window: number of neighbours of each fit
+        :param iterations: number of robustifying iterations
+        :param delta: after each fit, the next one is done at the last
+                      value within delta (abscissa units) of it, the values
+                      in between are linearly interpolated (as statsmodels)
+        :param workers: number of processes fitting overlapping chunks of
+                        the series (default None fits in this process)
+        :param span: if given, each value is fitted on the values within
+                     span / 2 (abscissa units) of it instead of its window
+                     nearest neighbours
+
+        :return: array of the fitted values
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(np.isfinite(values) & np.isfinite(x))
+    order = valid[np.argsort(x[valid], kind='stable')]
+    xs = x[order]
+    ys = values[order]
+    n = len(xs)
+    if n == 0:
+        return out
+    k = min(max(int(window), 1), n)
+
+    points = _lowessPoints(xs, delta)
+    if span is None:
+        left = _nearestWindows(xs, points, k)
+        count = np.full(len(points), k)
+        radius = np.maximum(xs[points] - xs[left], xs[left + k - 1] - xs[points])
+    else:
+        left = np.searchsorted(xs, xs[points] - span / 2., side='left')
+        count = np.searchsorted(xs, xs[points] + span / 2., side='right') - left
+        radius = np.full(len(points), span / 2.)
+
+    # chunks of points with the overlapping slices of data they need
+    nbChunks = 1
+    if workers is not None and workers > 1:
+        nbChunks = min(4 * workers, len(points))
+    bounds = np.linspace(0, len(points), nbChunks + 1).astype(np.int64)
+
+    pool = None
+    if nbChunks > 1:
+        pool = multiprocessing.Pool(workers)
+    try:
+        robust = np.ones(n)
+        for iteration in range(iterations + 1):
+            tasks = []
+            for (a, b) in zip(bounds[:-1], bounds[1:]):
+                first = left[a]
+                last = (left[a:b] + count[a:b]).max()
+                tasks.append((xs[first:last], ys[first:last], robust[first:last],
+                    left[a:b] - first, count[a:b], radius[a:b], points[a:b] - first))
+            if pool is None:
+                fits = [_lowessChunk(task) for task in tasks]
+            else:
+                fits = pool.map(_lowessChunk, tasks)
+            fit = np.concatenate(fits)
+            if len(points) < n:
+                fit = np.interp(xs, xs[points], fit)
+            if iteration == iterations:
+                break
+
+            # bisquare weights of the residuals
+            residuals = np.abs(ys - fit)
+            scale = 6. * np.median(residuals)
+            if scale == 0:
+                # (as statsmodels: only the exactly fitted values keep a weight)
+                robust = (residuals == 0).astype(np.float64)
+            else:
+                u = residuals / scale
+                robust = np.where(u < 1, (1. - u**2)**2, 0.)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    out[order] = fit
+    return out
+#===============================================================================
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+#
+
+'''
+    interpolation of sampled values from one clock to another
+'''
+
+import numpy as np
+
+from processing.filters import runningMean
+
+# resampling kernels -> InterpolationPlan method
+KERNELS = {'nearest': 'nearest', 'linear': 'linear', 'cubic': 'cubic', 'block': 'blockAverage'}
+
+
+class InterpolationPlan:
+    '''
+    bracketing indices and weights from a source clock to a target clock,
+    computed once and applied to any number of columns sampled on the source clock
+    '''
+
+    def __init__(self, xOrig, xOut):
+        '''
+            constructor
+
+            :param xOrig: increasing array of source times (seconds)
+            :param xOut: array of target times (seconds)
+        '''
+        self.xOrig = np.asarray(xOrig, dtype=np.float64)
+        self.xOut = np.asarray(xOut, dtype=np.float64)
+        if len(self.xOrig) == 0:
+            raise Exception("cannot interpolate from an empty clock")
+
+        # last source sample at or before each target time
+        last = len(self.xOrig) - 1
+        self.lo = np.clip(np.searchsorted(self.xOrig, self.xOut, side='right') - 1, 0, max(last - 1, 0))
+        hi = np.minimum(self.lo + 1, last)
+
+        # weights of the upper samples, clamped as np.interp outside the clock
+        dx = self.xOrig[hi] - self.xOrig[self.lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = (self.xOut - self.xOrig[self.lo]) / dx
+        # (repeated source times only happen at the ends of the clock)
+        weights[dx == 0] = self.xOut[dx == 0] >= self.xOrig[hi][dx == 0]
+        self.weights = np.clip(weights, 0., 1.)
+
+    def __len__(self):
+        return len(self.xOut)
+
+    def apply(self, values, kernel='linear'):
+        '''
+            resamples values sampled on the source clock
+
+            :param values: array of shape (n,) or stack of k columns of shape (k, n)
+            :param kernel: resampling kernel, one of KERNELS
+
+            :return: array of shape (len(xOut),) or (k, len(xOut))
+        '''
+        if kernel not in KERNELS:
+            raise Exception("unknown resampling kernel %s (expected one of %s)" %(kernel, ', '.join(KERNELS)))
+        values = np.asarray(values, dtype=np.float64)
+        return getattr(self, KERNELS[kernel])(values)
+
+    def linear(self, values):
+        '''
+            linear interpolation, clamped to the first/last value outside the source clock
+        '''
+        if values.shape[-1] == 1:
+            return np.take(values, self.lo, axis=-1)
+
+        # lower samples plus weighted steps to the upper ones
+        out = np.take(values, self.lo, axis=-1)
+        steps = np.take(np.diff(values, axis=-1), self.lo, axis=-1)
+        steps *= self.weights
+        out += steps
+        return out
+
+    def nearest(self, values):
+        '''
+            value of the nearest source sample (for categorical fields)
+        '''
+        index = np.minimum(self.lo + (self.weights > 0.5), values.shape[-1] - 1)
+        return np.take(values, index, axis=-1)
+
+    def cubic(self, values):
+        '''
+            monotone piecewise cubic (PCHIP) interpolation: no overshoot
+            between samples, clamped outside the source clock
+        '''
+        n = values.shape[-1]
+        if n < 3:
+            return self.linear(values)
+
+        # secant slopes, repeated source times give flat intervals
+        h = np.diff(self.xOrig)
+        dy = np.diff(values, axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = np.where(h > 0, dy / h, 0.)
+
+        # Fritsch-Carlson derivatives: weighted harmonic mean of the
+        # neighbouring slopes, zero at local extrema
+        d = np.zeros(values.shape)
+        w1 = 2 * h[1:] + h[:-1]
+        w2 = h[1:] + 2 * h[:-1]
+        left = delta[..., :-1]
+        right = delta[..., 1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            interior = (w1 + w2) / (w1 / left + w2 / right)
+        d[..., 1:-1] = np.where(left * right > 0, interior, 0.)
+
+        # shape preserving three points formula at the ends
+        d[..., 0] = self._endDerivative(h[0], h[1], delta[..., 0], delta[..., 1])
+        d[..., -1] = self._endDerivative(h[-1], h[-2], delta[..., -1], delta[..., -2])
+
+        # cubic Hermite basis on each bracketing interval
+        t = self.weights
+        t2 = t * t
+        t3 = t2 * t
+        width = np.take(h, self.lo)
+        out = np.take(values, self.lo, axis=-1) * (2 * t3 - 3 * t2 + 1)
+        out += np.take(values, self.lo + 1, axis=-1) * (3 * t2 - 2 * t3)
+        out += np.take(d, self.lo, axis=-1) * ((t3 - 2 * t2 + t) * width)
+        out += np.take(d, self.lo + 1, axis=-1) * ((t3 - t2) * width)
+        return out
+
+    def _endDerivative(self, h0, h1, delta0, delta1):
+        '''
+            derivative at an end of the source clock for the cubic kernel
+        '''
+        if h0 + h1 == 0:
+            return np.zeros(np.shape(delta0))
+        d = ((2 * h0 + h1) * delta0 - h0 * delta1) / (h0 + h1)
+        d = np.where(np.sign(d) != np.sign(delta0), 0., d)
+        return np.where((np.sign(delta0) != np.sign(delta1)) & (np.abs(d) > np.abs(3 * delta0)), 3 * delta0, d)
+
+    def blockAverage(self, values):
+        '''
+            mean of the source samples within each target interval (bounded by
+            the midpoints between target times), NaNs are ignored;
+            targets without any valid source sample are interpolated linearly
+        '''
+        if len(self.xOut) < 2:
+            return self.linear(values)
+        first, last = self._blockBounds()
+        out = runningMean(values, first, last)
+        # (NaN only for targets without any valid source sample)
+        return np.where(np.isnan(out), self.linear(values), out)
+
+    def _blockBounds(self):
+        '''
+            first and last (excluded) source indices of each target interval
+        '''
+        if not hasattr(self, '_bounds'):
+            if np.any(np.diff(self.xOut) < 0):
+                raise Exception("block averaging needs increasing target times")
+            edges = np.empty(len(self.xOut) + 1)
+            edges[1:-1] = 0.5 * (self.xOut[1:] + self.xOut[:-1])
+            edges[0] = self.xOut[0] - 0.5 * (self.xOut[1] - self.xOut[0])
+            edges[-1] = self.xOut[-1] + 0.5 * (self.xOut[-1] - self.xOut[-2])
+            index = np.searchsorted(self.xOrig, edges, side='left')
+            self._bounds = (index[:-1], index[1:])
+        return self._bounds
+
+    def applyColumns(self, columns, kernels=None):
+        '''
+            resamples several columns at once, one stacked operation per kernel
+
+            :param columns: dictionnary of arrays sampled on the source clock
+            :param kernels: dictionnary of column -> kernel (default linear)
+
+            :return: dictionnary of resampled arrays
+        '''
+        if kernels is None:
+            kernels = dict()
+        groups = dict()
+        for key in columns.keys():
+            groups.setdefault(kernels.get(key, 'linear'), []).append(key)
+
+        out = dict()
+        for kernel in groups.keys():
+            keys = groups[kernel]
+            stack = self.apply(np.vstack([columns[key] for key in keys]), kernel=kernel)
+            for (i, key) in enumerate(keys):
+                out[key] = stack[i]
+        return out
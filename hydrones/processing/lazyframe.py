@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+
+'''
+    dataframe whose columns are computed on first access
+'''
+
+import pandas as pd
+
+
+class LazyFrame:
+    '''
+    dataframe-like container: columns are computed on first access by a
+    resolver function and memoized in a pandas dataframe
+    '''
+
+    def __init__(self, index, keys, resolve):
+        '''
+            constructor
+
+            :param index: datetime array of the rows
+            :param keys: ordered names of the columns
+            :param resolve: function computing a list of columns, returning a
+                            dictionnary of column name -> array
+        '''
+        self.index = pd.DatetimeIndex(index)
+        self._keys = list(keys)
+        self._resolve = resolve
+        self._frame = pd.DataFrame(index=self.index)
+
+    @property
+    def columns(self):
+        return pd.Index(self._keys)
+
+    def keys(self):
+        return self.columns
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self.index)
+
+    def materialized(self):
+        '''
+            names of the columns computed so far
+        '''
+        return [key for key in self._keys if key in self._frame.columns]
+
+    def materialize(self, keys=None):
+        '''
+            computes the missing columns among keys (default all)
+        '''
+        if keys is None:
+            keys = self._keys
+        for key in keys:
+            if key not in self._keys:
+                raise KeyError(key)
+        missing = [key for key in keys if key not in self._frame.columns]
+        if len(missing) > 0:
+            values = self._resolve(missing)
+            self._frame = pd.concat([self._frame, pd.DataFrame(dict((key, values[key]) for key in missing),
+                index=self.index)], axis=1)
+        return 0
+
+    def __getitem__(self, key):
+        if isinstance(key, list):
+            self.materialize(key)
+        else:
+            self.materialize([key])
+        return self._frame[key]
+
+    def __setitem__(self, key, value):
+        self._frame[key] = value
+        if key not in self._keys:
+            self._keys.append(key)
+
+    def toDataframe(self):
+        '''
+            computes all columns
+
+            :return: pandas dataframe
+        '''
+        self.materialize()
+        return self._frame[self._keys]
+
+    def dropna(self, axis=0, inplace=False, **kwargs):
+        '''
+            pandas dropna on all columns (all of them are computed)
+        '''
+        frame = self.toDataframe().dropna(axis=axis, **kwargs)
+        if not inplace:
+            return frame
+        self._frame = frame
+        self.index = frame.index
+        self._keys = list(frame.columns)
+        return None
+
+    def __copy__(self):
+        other = LazyFrame(self.index, self._keys, self._resolve)
+        other._frame = self._frame.copy(deep=False)
+        return other
+
+    @property
+    def iloc(self):
+        return _LazyRows(self)
+
+
+class _LazyRows:
+    '''
+    positional row selection of a LazyFrame, the selected rows stay lazy
+    '''
+
+    def __init__(self, frame):
+        self._parent = frame
+
+    def __getitem__(self, rows):
+        if isinstance(rows, tuple) and len(rows) == 1:
+            rows = rows[0]
+        parent = self._parent
+
+        # (slices of the parent columns are views)
+        def resolve(keys):
+            return dict((key, parent[key].values[rows]) for key in keys)
+
+        return LazyFrame(parent.index[rows], parent.keys(), resolve)
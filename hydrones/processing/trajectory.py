@@ -11,9 +11,37 @@ import pandas as pd
 import datetime as dt
 from input.telemetry import readTmDirectory
 from input.dronelogs import readLogDirectory
+from processing.interpolation import InterpolationPlan
+from processing.lazyframe import LazyFrame
+from processing.filters import boxKernel, convolve, lanczosKernel, lowess, medianFilter, \
+    runningMean, runningMeanStd, runningMedian, sampleWindows, timeLanczos, timeWindows
 import copy
 import pdb
 
+# default resampling kernel of the columns fused onto the leddar clock
+# (see processing.interpolation.KERNELS, other columns are interpolated linearly)
+RESAMPLING = {'gps_nbsat': 'nearest'}
+
+def _fillGaps(values):
+    """
+        replaces NaNs by a linear interpolation of their valid neighbours
+    """
+    valid = np.isfinite(values)
+    if valid.all() or not valid.any():
+        return values
+    index = np.arange(len(values))
+    return np.where(valid, values, np.interp(index, index[valid], values[valid]))
+
+# formulas of the derived columns (see Trajectory.defineColumn)
+def _mispointing(roll, pitch):
+    return np.sqrt(roll**2 + pitch**2)
+
+def _correctedRange(range, mispointing):
+    return range * np.cos(np.radians(mispointing))
+
+def _seaSurface(altitude, range):
+    return altitude - range
+
 class Trajectory:
     '''
     class to hold trajectories data and manipulate them
@@ -21,7 +49,7 @@ class Trajectory:
 
     def __init__(self, tmDir=None, tmPattern='HD*', tmMode='mode1',
                     logDir=None, logPattern='*.csv',
-                    df=None, secOffset=17.0):
+                    df=None, secOffset=17.0, resampling=None, lazy=False):
         '''
             constructor
 
@@ -30,13 +58,24 @@ class Trajectory:
             :param logDir: directory to read log files from
             :param logPattern: pattern to select log files
             :param secOffset: nb seonds to shift in UTC
+            :param resampling: dictionnary of column -> resampling kernel
+                               (nearest, linear, cubic or block), overrides RESAMPLING
+            :param lazy: if True, data columns are only interpolated on first access
+                         (see lazyDataframe)
         '''
 
+        # derived columns definitions, and versions of the columns they depend on
+        self._derived = dict()
+        self._derivedState = dict()
+        self._versions = dict()
+        self._generation = 0
+
         # fill object from a dataframe
         if df is not None:
             self.data = df
-            self.timeIndex = np.array([pd.Timestamp(i).to_datetime() for i in self.data.index.values])
+            self._updateTimeIndex()
             self.origDate = self.timeIndex[0]
+            self.timeSeconds = self.datetimeToSeconds(self.timeIndex, self.origDate)
 
         else:
             # read telemetry files
@@ -51,23 +90,28 @@ class Trajectory:
                 self._logMeasure = log
 
             # get the origin of dates to the first GPS date
-            self.origDate = dt.datetime(int(self._tmMeasure['year'][0]),
+            self.origDate = np.datetime64(dt.datetime(int(self._tmMeasure['year'][0]),
             int(self._tmMeasure['month'][0]),
             int(self._tmMeasure['day'][0]),
             int(self._tmMeasure['hour'][0]),
             int(self._tmMeasure['min'][0]),
             int(self._tmMeasure['sec'][0]),
-            int(self._tmMeasure['usec'][0])) + dt.timedelta(seconds=secOffset)
+            int(self._tmMeasure['usec'][0])) + dt.timedelta(seconds=secOffset), 'ns')
 
             # reference all clock to the first GPS clock and date
             for k in self._tmClock.keys():
                 self._tmClock[k] = self._tmClock[k] - self._tmClock['gps'][0]
 
             # create the main time index from leddar clock values
-            self.timeIndex = self.secondsToDatetime(self._tmClock['leddar'], self.origDate)
+            # (datetime64[ns] dates and float seconds from origDate)
+            self.timeSeconds = np.asarray(self._tmClock['leddar'], dtype=np.float64)
+            self.timeIndex = self.secondsToDatetime(self.timeSeconds, self.origDate)
 
             # interpolate everything to leddar dates
-            self.data = self.everythingToDataframe(index=self.timeIndex)
+            if lazy:
+                self.data = self.lazyDataframe(index=self.timeIndex, resampling=resampling)
+            else:
+                self.data = self.everythingToDataframe(index=self.timeIndex, resampling=resampling)
 
 #===============================================================================
 # dates interpolation
@@ -83,99 +127,158 @@ class Trajectory:
         """
         xOrigSeconds = self.datetimeToSeconds(xOrig, xOrig[0])
         xOutSeconds = self.datetimeToSeconds(xOut, xOrig[0])
-        yOut = np.interp(xOutSeconds, xOrigSeconds, yOrig)
+        yOut = InterpolationPlan(xOrigSeconds, xOutSeconds).apply(yOrig)
         return yOut
 
     def secondsToDatetime(self, seconds, origDate):
         """
             convert seconds from origDate to datetime array
 
-            :param seconds: array of seconds
+            :param seconds: array of seconds (negative before origDate)
             :param origDate: date of origin
 
-            :return: array of datetimes
+            :return: datetime64[ns] array
         """
-        datetimes = []
-        for i in seconds:
-            if i < 0:
-                datetimes.append(origDate - dt.timedelta(seconds=i))
-            else:
-                datetimes.append(origDate + dt.timedelta(seconds=i))
-        return np.array(datetimes)
+        ns = np.rint(np.asarray(seconds, dtype=np.float64) * 1e9).astype(np.int64)
+        return np.datetime64(origDate, 'ns') + ns.astype('timedelta64[ns]')
 
     def datetimeToSeconds(self, datetimes, origDate):
         """
             convert datetime array to seconds from origDate
 
-            :param datetimes: array of datetimes objects
+            :param datetimes: array of dates (datetime64 or datetimes objects)
             :param origDate: origin of dates for conversion
 
-            :return: array of seconds from origDate
+            :return: array of seconds from origDate (negative before origDate)
         """
-        orientation=[]
-        for date in datetimes:
-            if date < origDate:
-                orientation.append(-1.)
-            else:
-                orientation.append(1.)
-        seconds = [(i - origDate).total_seconds() for i in datetimes]
-        return np.multiply(seconds, np.array(orientation))
+        datetimes = np.asarray(datetimes, dtype='datetime64[ns]')
+        return (datetimes - np.datetime64(origDate, 'ns')) / np.timedelta64(1, 's')
 
     def _updateTimeIndex(self):
         """
-            rebuilds timeIndex from data.index
+            rebuilds timeIndex (and the seconds from origDate) from data.index
         """
-        self.timeIndex = np.array([pd.Timestamp(i).to_datetime() for i in self.data.index.values])
+        self.timeIndex = np.asarray(self.data.index.values, dtype='datetime64[ns]')
+        if hasattr(self, 'origDate'):
+            self.timeSeconds = self.datetimeToSeconds(self.timeIndex, self.origDate)
         return 0
 #===============================================================================
 
 #===============================================================================
 # dataframe manipulation
-    def everythingToDataframe(self, index=None):
+    def _sourceColumns(self):
+        """
+            groups the tm and log columns to interpolate by source clock
+
+            :return: dictionnary of source name (imu, baro, gps, log) -> dictionnary of columns
+        """
+        sources = dict()
+        for key in self._tmMeasure.keys():
+            # (the last matching sensor wins, as gps_* keys are gps ones)
+            sensor = None
+            for name in ['imu', 'baro', 'gps']:
+                if name in key:
+                    sensor = name
+            if sensor is not None:
+                sources.setdefault(sensor, dict())[key] = self._tmMeasure[key]
+
+        for key in self._logMeasure.keys():
+            if key == 'TimeUS' or key =='AbsoluteDate':
+                continue
+            sources.setdefault('log', dict())[key] = self._logMeasure[key]
+        return sources
+
+    def _interpolationPlan(self, source, indexSeconds):
+        """
+            interpolation plan from a source clock (imu, baro, gps or log) to indexSeconds
+        """
+        if source == 'log':
+            sourceSeconds = self.datetimeToSeconds(self._logMeasure['AbsoluteDate'], self.origDate)
+        else:
+            sourceSeconds = self._tmClock[source]
+        return InterpolationPlan(sourceSeconds, indexSeconds)
+
+    def _fusedKeys(self):
+        """
+            names of the fused columns, in the order of the tm then log fields
+        """
+        sources = self._sourceColumns()
+        interpolated = set()
+        for source in sources.keys():
+            interpolated.update(sources[source].keys())
+        keys = [key for key in self._tmMeasure.keys() if 'leddar' in key or key in interpolated]
+        keys += [key for key in self._logMeasure.keys() if key in interpolated]
+        return keys
+
+    def _columnResolver(self, index, resampling=None):
+        """
+            function computing fused columns on index, the interpolation
+            plans are built on first use and shared by all calls
+
+            :param index: datetime array of output data
+            :param resampling: dictionnary of column -> resampling kernel, overrides RESAMPLING
+
+            :return: function of a list of keys returning a dictionnary of arrays
+        """
+        kernels = dict(RESAMPLING)
+        if resampling is not None:
+            kernels.update(resampling)
+
+        # all interpolations are done on seconds from origDate
+        indexSeconds = self.datetimeToSeconds(index, self.origDate)
+        sources = self._sourceColumns()
+        plans = dict()
+
+        def resolve(keys):
+            columns = dict()
+            for key in keys:
+                if 'leddar' in key and key in self._tmMeasure:
+                    columns[key] = self._tmMeasure[key]
+            # one interpolation plan per source clock, applied to all its columns
+            for source in sources.keys():
+                wanted = dict((key, sources[source][key]) for key in keys if key in sources[source])
+                if len(wanted) == 0:
+                    continue
+                if source not in plans:
+                    plans[source] = self._interpolationPlan(source, indexSeconds)
+                columns.update(plans[source].applyColumns(wanted, kernels=kernels))
+            return columns
+
+        return resolve
+
+    def everythingToDataframe(self, index=None, resampling=None):
         """
             blends all tm and log data to a single dataframe
 
+            :param index: datetime array of output data
+            :param resampling: dictionnary of column -> resampling kernel
+                               (nearest, linear, cubic or block), overrides RESAMPLING
+
             :return: pandas dataframe containing everything
         """
         if index is None:
             raise Exception("an index must be given")
 
-        d = dict()
+        keys = self._fusedKeys()
+        columns = self._columnResolver(index, resampling=resampling)(keys)
+        d = dict((key, columns[key]) for key in keys)
+        return(pd.DataFrame(d, index=pd.DatetimeIndex(index)))
 
-        # hydrones tm fields
-        for key in self._tmMeasure.keys():
-            if 'leddar' in key:
-                d[key] = self._tmMeasure[key]
-
-            if 'imu' in key:
-                origVal = self._tmMeasure[key]
-                origDate = self.secondsToDatetime(self._tmClock['imu'], self.origDate)
-                interpVal = self.interpDateToDate(origDate, origVal, index)
-                d[key] = interpVal
-
-            if 'baro' in key:
-                origVal = self._tmMeasure[key]
-                origDate = self.secondsToDatetime(self._tmClock['baro'], self.origDate)
-                interpVal = self.interpDateToDate(origDate, origVal, index)
-                d[key] = interpVal
-
-            if 'gps' in key:
-                origVal = self._tmMeasure[key]
-                origDate = self.secondsToDatetime(self._tmClock['gps'], self.origDate)
-                interpVal = self.interpDateToDate(origDate, origVal, index)
-                d[key] = interpVal
-
-        # drone log fields
-        for key in self._logMeasure.keys():
-            if key == 'TimeUS' or key =='AbsoluteDate':
-                continue
-            origVal = self._logMeasure[key]
-            origSeconds = self.datetimeToSeconds(self._logMeasure['AbsoluteDate'], self.origDate)
-            origDate = self.secondsToDatetime(origSeconds, self.origDate)
-            interpVal = self.interpDateToDate(origDate, origVal, index)
-            d[key] = interpVal
+    def lazyDataframe(self, index=None, resampling=None):
+        """
+            same as everythingToDataframe, but each column is only interpolated
+            on its first access and then kept
 
-        return(pd.DataFrame(d, index=self.timeIndex))
+            :param index: datetime array of output data
+            :param resampling: dictionnary of column -> resampling kernel
+                               (nearest, linear, cubic or block), overrides RESAMPLING
+
+            :return: LazyFrame (use toDataframe() to get a pandas dataframe)
+        """
+        if index is None:
+            raise Exception("an index must be given")
+
+        return LazyFrame(index, self._fusedKeys(), self._columnResolver(index, resampling=resampling))
 #===============================================================================
 
 #===============================================================================
@@ -185,13 +288,64 @@ class Trajectory:
             performs a data selection based on times
 
             :param beginDate: first date of the selection
-            :param endDate: last date of the selection
+            :param endDate: last date of the selection (excluded)
+
+            :return: trajectory object containing the selection, sharing the
+                     data and time arrays of this one when the time index is sorted
+        """
+        if not self._isSorted():
+            index = np.where((self.timeIndex >= np.datetime64(beginDate, 'ns'))
+                & (self.timeIndex < np.datetime64(endDate, 'ns')))
+            df = self.data.iloc[index]
+            return Trajectory(df=df)
+        return self.timeSelections([(beginDate, endDate)])[0]
+
+    def timeSelections(self, windows):
+        """
+            performs several data selections based on times
+
+            :param windows: sequence of (beginDate, endDate) pairs
+
+            :return: list of trajectory objects containing the selections
+        """
+        if not self._isSorted():
+            return [self.timeSelection(beginDate, endDate) for (beginDate, endDate) in windows]
+        if len(windows) == 0:
+            return []
+
+        # binary search of all bounds at once
+        bounds = np.array([(np.datetime64(beginDate, 'ns'), np.datetime64(endDate, 'ns'))
+            for (beginDate, endDate) in windows])
+        first = np.searchsorted(self.timeIndex, bounds[:, 0], side='left')
+        last = np.maximum(np.searchsorted(self.timeIndex, bounds[:, 1], side='left'), first)
+        return [self._window(i, j) for (i, j) in zip(first, last)]
 
-            :return: trajectory object containing the selection
+    def _window(self, first, last):
         """
-        index = np.where((self.timeIndex >= beginDate) & (self.timeIndex < endDate))
-        df = self.data.iloc[index]
-        return Trajectory(df=df)
+            trajectory object on rows first to last (excluded), sharing the
+            data and time arrays of this one (the origin of dates is kept)
+        """
+        traj = Trajectory.__new__(Trajectory)
+        traj.data = self.data.iloc[first:last]
+        traj.origDate = self.origDate
+        traj.timeIndex = self.timeIndex[first:last]
+        traj.timeSeconds = self.timeSeconds[first:last]
+        traj._sortedIndex = traj.timeIndex
+        traj._derived = dict(self._derived)
+        traj._derivedState = dict(self._derivedState)
+        traj._versions = dict(self._versions)
+        traj._generation = self._generation
+        return traj
+
+    def _isSorted(self):
+        """
+            checks (once per time index) that the time index is increasing
+        """
+        if getattr(self, '_sortedIndex', None) is not self.timeIndex:
+            if np.any(self.timeIndex[1:] < self.timeIndex[:-1]):
+                return False
+            self._sortedIndex = self.timeIndex
+        return True
 #===============================================================================
 
 #===============================================================================
@@ -231,8 +385,7 @@ class Trajectory:
             dfInput[inputKey] = inputValues
         else:
             # add a new column to the dataframe
-            df = pd.DataFrame({outputKey: inputValues}, index=dfInput.index)
-            dfInput = pd.concat([dfInput, df], axis=1)
+            dfInput[outputKey] = inputValues
 
         # drop NaNs if needed
         if dropna:
@@ -242,101 +395,220 @@ class Trajectory:
         if inplace:
             self.data = dfInput
             self._updateTimeIndex()
+            self._generation += 1
             return 0
         else:
             return Trajectory(df=dfInput)
 
-    def iterativeEditing(self, key, filter='lowess', nStep=1, window=10, threshold=3, outKey=None, cutoff=None):
+    def iterativeEditing(self, key, filter='lowess', nStep=1, window=10, threshold=3, outKey=None, cutoff=None,
+            sigma='std', seconds=False):
         """
             perform a simple editing by removing points too far away from local filter output
 
+            each pass filters the kept values, then rejects the points whose
+            residual to the filter is further than threshold * sigma from the
+            local residual level (over window samples); passes stop when no
+            point changes or after nStep passes
+
             :param key: name of the column to perform on
-            :param iter: number of iterations
+            :param filter: filter giving the reference (see filter)
+            :param nStep: maximum number of passes
             :param window: width of the filtering window
             :param threshold: editing threshold (in stddev)
             :param outKey: name of the output column, if none, will return the data as an array
-        """
-        it = 0
+            :param cutoff: cutoff frequency of the lanczos filter
+            :param sigma: std (running mean and standard deviation of the residuals)
+                          or mad (running median and 1.4826 * median absolute deviation)
+            :param seconds: if True, window (and cutoff) are in seconds (see filter)
+
+            :return: boolean array, True for edited points (if outKey is None)
+        """
+        if sigma not in ['std', 'mad']:
+            raise Exception("unknown sigma %s (expected std or mad)" %sigma)
+        values = np.asarray(self.data[key].values, dtype=np.float64)
+        finite = np.isfinite(values)
+        edited = ~finite
+        if seconds:
+            (first, last) = timeWindows(self.datetimeToSeconds(self.timeIndex, self.timeIndex[0]), window)
+        else:
+            (first, last) = sampleWindows(len(values), window)
+        options = dict(seconds=seconds)
+        if cutoff is not None:
+            options['cutoff'] = cutoff
 
+        it = 0
         while it < nStep:
 
-            # filter the values
-            filteredValues = self.filter(key, filter=filter, window=10, outKey=None, cutoff=cutoff)
-
-            firstIndex = 0
-            lastIndex = firstIndex + window
+            # filter the kept values, filled where edited
+            kept = np.where(edited, np.nan, values)
+            filteredValues = self._filterValues(kept[np.newaxis], filter, window, **options)[0]
+            filteredValues = _fillGaps(filteredValues)
 
+            # local level and dispersion of the residuals of the kept values
+            residuals = values - filteredValues
+            keptResiduals = np.where(edited, np.nan, residuals)
+            if sigma == 'std':
+                (level, scale) = runningMeanStd(keptResiduals, first, last)
+            else:
+                level = runningMedian(keptResiduals, first, last)
+                scale = 1.4826 * runningMedian(np.abs(keptResiduals - level), first, last)
 
+            with np.errstate(invalid='ignore'):
+                rejected = np.abs(residuals - level) > threshold * scale
+            newEdited = ~finite | rejected
+            it += 1
+            if np.array_equal(newEdited, edited):
+                break
+            edited = newEdited
 
+        if outKey is None:
+            return edited
+        else:
+            self.setColumn(outKey, edited)
+            return 0
 
-    def filter(self, key, filter=None, window=10., cutoff=10., outKey=None):
+    def filter(self, key, filter=None, window=10., cutoff=10., outKey=None, delta=0., workers=None,
+            seconds=False):
         """
             filters the input column
-        """
-        import statsmodels.api as sm
-        from astropy.convolution import convolve, Box1DKernel
 
-        endog = self.data[key].values
+            :param key: name of the column, or list of names to filter several columns at once
+            :param filter: lowess, box, lanczos or median
+            :param window: width of the filtering window (samples, or seconds)
+            :param cutoff: cutoff frequency of the lanczos filter (cycles per sample, or Hz)
+            :param outKey: name (or list of names) of the output column,
+                           if None the filtered values are returned
+            :param delta: lowess fits at most every delta seconds and interpolates
+                          the values in between (see filters.lowess)
+            :param workers: number of processes running lowess on chunks of the series
+            :param seconds: if True, window is a duration centered on each
+                            sample whatever the sampling (lowess fits the
+                            samples within window / 2, box and median use
+                            them all, lanczos resamples the series uniformly)
+
+            :return: filtered values (stack of shape (k, n) for a list of keys) if outKey is None, 0 if not
+        """
+        keys = key if isinstance(key, list) else [key]
+        endog = np.vstack([np.asarray(self.data[k].values, dtype=np.float64) for k in keys])
+        filteredValues = self._filterValues(endog, filter, window, cutoff=cutoff, delta=delta, workers=workers,
+            seconds=seconds)
+
+        if not isinstance(key, list):
+            filteredValues = filteredValues[0]
+        if outKey is None:
+            return filteredValues
+        else:
+            if isinstance(key, list):
+                for (name, values) in zip(outKey, filteredValues):
+                    self.setColumn(name, values)
+            else:
+                self.setColumn(outKey, filteredValues)
+            return 0
+
+    def _filterValues(self, endog, filter, window=10., cutoff=10., delta=0., workers=None, seconds=False):
+        """
+            filters a stack of columns of shape (k, n) sampled on timeIndex (see filter)
+        """
         exog = self.datetimeToSeconds(self.timeIndex, self.timeIndex[0])
 
-        if filter=='lowess':
-            frac=window/len(self.timeIndex)
-            lowess = sm.nonparametric.lowess
-            filteredValues = lowess(endog, exog, frac=frac, return_sorted=False)
+        if seconds:
+            if filter=='lowess':
+                filteredValues = np.vstack([lowess(values, exog, window, delta=delta, workers=workers, span=window)
+                    for values in endog])
+            elif filter=='box':
+                (first, last) = timeWindows(exog, window)
+                filteredValues = runningMean(endog, first, last)
+            elif filter=='lanczos':
+                filteredValues = timeLanczos(endog, exog, window, cutoff)
+            elif filter=='median':
+                (first, last) = timeWindows(exog, window)
+                filteredValues = np.vstack([runningMedian(values, first, last) for values in endog])
+            else:
+                raise Exception("unknown filter %s" %filter)
+        elif filter=='lowess':
+            filteredValues = np.vstack([lowess(values, exog, window, delta=delta, workers=workers) for values in endog])
         elif filter=='box':
-            kernel = Box1DKernel(window)
-            filteredValues = convolve(endog, kernel, boundary='extend')
+            filteredValues = convolve(endog, boxKernel(window))
         elif filter=='lanczos':
             kernel = self._lanczosKernel(window=window, cutoff=cutoff)
-            filteredValues = convolve(endog, kernel, boundary='extend')
+            filteredValues = convolve(endog, kernel)
         elif filter=='median':
-            filteredValues = self._medfilt(endog, window)
-
-        if outKey is None:
-            return filteredValues
+            filteredValues = np.vstack([self._medfilt(values, window) for values in endog])
         else:
-            df = pd.DataFrame({outKey:filteredValues}, index=self.timeIndex)
-            pd.concat([self.data, df], axis=1)
-            return 0
+            raise Exception("unknown filter %s" %filter)
+        return filteredValues
 
     def _medfilt (self, x, k):
         """
-            Apply a length-k median filter to a 1D array x.
+            Apply a length-k running median filter to a 1D array x (NaNs are ignored).
             Boundaries are extended by repeating endpoints.
         """
-        assert k % 2 == 1, "Median filter length must be odd."
-        assert x.ndim == 1, "Input must be one-dimensional."
-        k2 = (k - 1) // 2
-        y = np.zeros ((len (x), k), dtype=x.dtype)
-        y[:,k2] = x
-        for i in range (k2):
-            j = k2 - i
-            y[j:,i] = x[:-j]
-            y[:j,i] = x[0]
-            y[:-j,-(i+1)] = x[j:]
-            y[-j:,-(i+1)] = x[-1]
-        return np.median (y, axis=1)
+        return medianFilter(x, k)
 
     def _lanczosKernel(self, window=None, cutoff=None):
         """
-            lanczos filter weights
+            lanczos filter weights (cached for each window and cutoff)
         """
-        order = ((window - 1) // 2 ) + 1
-        nwts = 2 * order + 1
-        w = np.zeros([nwts])
-        n = nwts // 2
-        w[n] = 2 * cutoff
-        k = np.arange(1., n)
-        sigma = np.sin(np.pi * k / n) * n / (np.pi * k)
-        firstfactor = np.sin(2. * np.pi * cutoff * k) / (np.pi * k)
-        w[n-1:0:-1] = firstfactor * sigma
-        w[n+1:-1] = firstfactor * sigma
-        return w[1:-1]
+        return lanczosKernel(window, cutoff)
 
 #===============================================================================
 
 #===============================================================================
 # calcul de paramètres
+    def setColumn(self, key, values):
+        """
+            stores a column, derived columns depending on it will be recomputed
+            (columns written directly in self.data are not tracked)
+
+            :param key: name of the column
+            :param values: array of values
+        """
+        self.data[key] = values
+        self._versions[key] = self._versions.get(key, 0) + 1
+        return 0
+
+    def defineColumn(self, key, inputs, function):
+        """
+            declares a derived column
+
+            :param key: name of the derived column
+            :param inputs: names of the columns (stored or derived) it is computed from
+            :param function: vectorized function of the input arrays returning the column
+                             e.g. defineColumn('depth', ['sea_surface'], lambda s: s.mean() - s)
+        """
+        self._derived[key] = (list(inputs), function)
+        self._derivedState.pop(key, None)
+        return 0
+
+    def derive(self, key=None):
+        """
+            computes a derived column, unless none of its inputs changed
+            since the last computation
+
+            :param key: name of the derived column (default all of them)
+
+            :return: array of the derived column (None for all of them)
+        """
+        if key is None:
+            for name in list(self._derived.keys()):
+                self.derive(name)
+            return None
+        if key not in self._derived:
+            raise Exception("%s is not a derived column" %key)
+
+        (inputs, function) = self._derived[key]
+        # derived inputs are brought up to date first
+        for name in inputs:
+            if name in self._derived:
+                self.derive(name)
+
+        state = (self._generation,) + tuple(self._versions.get(name, 0) for name in inputs)
+        if self._derivedState.get(key) != state or key not in self.data:
+            values = function(*[np.asarray(self.data[name].values, dtype=np.float64) for name in inputs])
+            self.setColumn(key, values)
+            self._derivedState[key] = state
+        return self.data[key].values
+
     def mispointingEstimation(self, rangeKey='range',
         rollKey='roll',
         pitchKey='pitch',
@@ -351,27 +623,9 @@ class Trajectory:
             :param mispointKey: name of the mispointing column (sqrt(roll^2 + pitch^2))
             :param corrRangeKey: name of the corrected range column (range * cos(mispointing))
         """
-        from math import cos, sqrt, radians
-
-        # estimate the mispointing
-        mispointing = [sqrt(self.data[rollKey][i]**2 + self.data[pitchKey][i]**2) for i in np.arange(len(self.data.index))]
-
-        # correct the range
-        correctedRange = [self.data[rangeKey][i] * cos(radians(mispointing[i])) for i in np.arange(len(self.data.index))]
-
-        # store the results
-        if mispointKey in self.data.keys():
-            self.data[mispointKey] = mispointing
-        else:
-            df = pd.DataFrame({mispointKey: mispointing}, index=self.data.index)
-            self.data = pd.concat([self.data, df], axis=1)
-
-        if corrRangeKey in self.data.keys():
-            self.data[corrRangeKey] = correctedRange
-        else:
-            df = pd.DataFrame({corrRangeKey: correctedRange}, index=self.data.index)
-            self.data = pd.concat([self.data, df], axis=1)
-
+        self.defineColumn(mispointKey, [rollKey, pitchKey], _mispointing)
+        self.defineColumn(corrRangeKey, [rangeKey, mispointKey], _correctedRange)
+        self.derive(corrRangeKey)
         return 0
 
     def levelEstimation(self, altKey='altitude', rangeKey='leddar_range', outKey='sea_surface'):
@@ -382,10 +636,8 @@ class Trajectory:
             :param rangeKey: name of the range column
             :param outKey: name of the resulting column
         """
-
-        out = [self.data[altKey][i] - self.data[rangeKey][i] for i in np.arange(len(self.data.index))]
-        df = pd.DataFrame({outKey: out}, index=self.data.index)
-        self.data = pd.concat([self.data, df], axis=1)
+        self.defineColumn(outKey, [altKey, rangeKey], _seaSurface)
+        self.derive(outKey)
         return 0
 #===============================================================================
 